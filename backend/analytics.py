@@ -0,0 +1,153 @@
+import os
+import json
+import asyncio
+from collections import deque, Counter
+from datetime import datetime, timezone
+from typing import Optional, Dict
+
+from db import db_pool, ConnectionPool
+
+# Настройки буфера аналитики
+ANALYTICS_BUFFER_SIZE = int(os.getenv("ANALYTICS_BUFFER_SIZE", "10000"))
+ANALYTICS_FLUSH_INTERVAL = float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "1.0"))  # секунд
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "1000"))
+RECENT_ACTIONS_LIMIT = 10  # размер кольца последних событий на пользователя
+
+
+def apply_rollups(conn, batch):
+    """Инкрементально обновить агрегаты по пачке событий (user_id, action, data, timestamp)"""
+    totals = Counter((user_id, action) for user_id, action, _, _ in batch)
+    daily = Counter((user_id, timestamp[:10], action) for user_id, action, _, timestamp in batch)
+    conn.executemany(
+        "INSERT INTO user_action_counts(user_id, action, count) VALUES(?,?,?) "
+        "ON CONFLICT(user_id, action) DO UPDATE SET count = count + excluded.count",
+        [(user_id, action, count) for (user_id, action), count in totals.items()]
+    )
+    conn.executemany(
+        "INSERT INTO user_action_daily(user_id, day, action, count) VALUES(?,?,?,?) "
+        "ON CONFLICT(user_id, day, action) DO UPDATE SET count = count + excluded.count",
+        [(user_id, day, action, count) for (user_id, day, action), count in daily.items()]
+    )
+    conn.executemany(
+        "INSERT INTO user_recent_actions(user_id, action, data, timestamp) VALUES(?,?,?,?)",
+        batch
+    )
+    # Обрезаем кольцо до RECENT_ACTIONS_LIMIT последних событий у затронутых пользователей
+    conn.executemany(
+        "DELETE FROM user_recent_actions WHERE user_id=? AND id <= "
+        "(SELECT id FROM user_recent_actions WHERE user_id=? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+        [(user_id, user_id, RECENT_ACTIONS_LIMIT) for user_id in {event[0] for event in batch}]
+    )
+
+
+class AnalyticsBuffer:
+    """Буфер событий аналитики: запись в память, пакетный сброс в БД фоновой задачей"""
+
+    def __init__(self, pool: ConnectionPool, max_size: int = ANALYTICS_BUFFER_SIZE,
+                 flush_interval: float = ANALYTICS_FLUSH_INTERVAL, batch_size: int = ANALYTICS_BATCH_SIZE):
+        self.pool = pool
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._events = deque()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flushing: Optional[asyncio.Future] = None  # сброс, выполняющийся в исполнителе
+        self.dropped = 0
+        self.written = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def record(self, user_id: int, action: str, data: Optional[Dict] = None) -> bool:
+        """Поставить событие в очередь; при переполнении событие отбрасывается"""
+        if len(self._events) >= self.max_size:
+            self.dropped += 1
+            return False
+        self._events.append(
+            (user_id, action, json.dumps(data) if data else None, datetime.now(timezone.utc).isoformat())
+        )
+        if self._wakeup is not None and len(self._events) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """Записать накопленные события и их агрегаты пачками, каждая пачка - одна транзакция"""
+        total = 0
+        while self._events:
+            batch = []
+            while self._events and len(batch) < self.batch_size:
+                batch.append(self._events.popleft())
+            try:
+                with self.pool.connection() as conn:
+                    conn.executemany(
+                        "INSERT INTO user_analytics(user_id, action, data, timestamp) VALUES(?,?,?,?)",
+                        batch
+                    )
+                    apply_rollups(conn, batch)
+                    conn.commit()
+            except Exception as e:
+                self.failed_flushes += 1
+                # Возвращаем пачку в начало очереди, если есть место, иначе считаем потерянной
+                room = self.max_size - len(self._events)
+                if room > 0:
+                    self._events.extendleft(reversed(batch[:room]))
+                self.dropped += max(0, len(batch) - max(room, 0))
+                print(f"Ошибка записи аналитики: {e}")
+                break
+            total += len(batch)
+        if total:
+            self.written += total
+            self.flushes += 1
+        return total
+
+    async def _run(self):
+        """Фоновый цикл сброса буфера"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._events:
+                self._flushing = loop.run_in_executor(None, self.flush)
+                # shield: отмена задачи в stop() не должна терять из виду идущий в потоке сброс
+                await asyncio.shield(self._flushing)
+
+    def start(self):
+        """Запустить фоновую задачу сброса"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую задачу и выполнить финальный сброс"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        if self._flushing is not None:
+            # Два сброса одновременно разбирали бы одну очередь из разных потоков
+            try:
+                await self._flushing
+            except Exception as e:
+                print(f"Ошибка записи аналитики: {e}")
+            self._flushing = None
+        await asyncio.get_running_loop().run_in_executor(None, self.flush)
+
+    def stats(self) -> Dict:
+        """Состояние буфера для мониторинга"""
+        return {
+            "queued": len(self._events),
+            "dropped": self.dropped,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+        }
+
+
+analytics_buffer = AnalyticsBuffer(db_pool)
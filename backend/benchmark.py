@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный бенчмарк API Гнома Гороскопа
+
+Создаёт временную БД с синтетическими данными (пользователи с настройками, избранным,
+аналитикой и репостами), прогоняет все эндпоинты main.py с заданной конкурентностью
+через in-process ASGI клиент и через настоящий uvicorn, выводит пропускную способность
+и задержки p50/p95/p99 по каждому эндпоинту и сохраняет результат в JSON для сравнения
+между коммитами.
+
+    python benchmark.py --users 500 --requests 1000 --concurrency 50 --output results.json
+"""
+
+import os
+import sys
+import json
+import time
+import hmac
+import random
+import shutil
+import asyncio
+import hashlib
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone, timedelta
+from urllib.parse import urlencode
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_BOT_TOKEN = "123456:benchmark-token"
+SIGNS = ["Овен", "Телец", "Близнецы", "Рак", "Лев", "Дева",
+         "Весы", "Скорпион", "Стрелец", "Козерог", "Водолей", "Рыбы"]
+ACTIONS = ["get_horoscope", "get_day_card", "add_favorite", "save_settings", "share_content"]
+
+
+def signed_init_data(user_id: int, bot_token: str = BENCH_BOT_TOKEN) -> str:
+    """initData, подписанный так же, как это делает Telegram WebApp"""
+    fields = {
+        "auth_date": str(int(time.time())),
+        "query_id": f"bench{user_id}",
+        "user": json.dumps({"id": user_id, "first_name": f"Bench{user_id}"}, separators=(",", ":")),
+    }
+    data_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    fields["hash"] = hmac.new(secret, data_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode(fields)
+
+
+def seed_database(path: str, users: int, rng: random.Random) -> Dict:
+    """Заполнить БД синтетическими данными; возвращает id пользователей и репостов"""
+    from db import ConnectionPool
+    from analytics import apply_rollups
+    import dal
+
+    pool = ConnectionPool(path, size=1)
+    pool.open()
+    now = datetime.now(timezone.utc)
+    user_ids = list(range(100000, 100000 + users))
+    share_ids = []
+    with pool.connection() as conn:
+        for user_id in user_ids:
+            sign = rng.choice(SIGNS)
+            # Без времени уведомления: бенчмарк не должен ставить рассылку в очередь
+            dal.save_user_settings(conn, user_id, {
+                "zodiac_sign": sign,
+                "birth_time": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+                "birth_location": rng.choice(["Москва", "Казань", "Новосибирск", None]),
+                "notification_time": None,
+            }, now.isoformat())
+            for n in range(rng.randint(5, 60)):
+                # Общий контент (гороскоп дня, карты) повторяется между пользователями
+                content = {"sign": rng.choice(SIGNS), "text": f"Гороскоп #{rng.randint(1, 200)}"}
+                added_at = (now - timedelta(minutes=n * 37 + rng.randint(0, 30))).isoformat()
+                dal.add_favorite(conn, user_id, rng.choice(["horoscope", "card"]), content, added_at)
+            events = []
+            for n in range(rng.randint(20, 200)):
+                timestamp = (now - timedelta(hours=rng.randint(0, 24 * 60))).isoformat()
+                events.append((user_id, rng.choice(ACTIONS), json.dumps({"sign": sign}), timestamp))
+            conn.executemany(
+                "INSERT INTO user_analytics(user_id, action, data, timestamp) VALUES(?,?,?,?)", events
+            )
+            apply_rollups(conn, events)
+            for _ in range(rng.randint(0, 3)):
+                share_ids.append(dal.add_shared_content(
+                    conn, user_id, "horoscope", {"sign": sign, "text": "Поделюсь гороскопом"},
+                    "Мой гороскоп", now.isoformat()
+                ))
+        conn.commit()
+    pool.close()
+    return {"user_ids": user_ids, "share_ids": share_ids}
+
+
+# Сценарий: имя -> функция (rng, данные) -> (метод, путь, query-параметры, JSON)
+Request = Tuple[str, str, Optional[Dict], Optional[Dict]]
+
+
+def build_scenarios(data: Dict) -> Dict[str, Callable[[random.Random], Request]]:
+    users = data["user_ids"]
+    init = {user_id: signed_init_data(user_id) for user_id in users}
+    shares = data["share_ids"] or [1]
+
+    def user(rng: random.Random) -> int:
+        return rng.choice(users)
+
+    today = datetime.now(timezone.utc).date()
+    week = [(today + timedelta(days=offset)).isoformat() for offset in (0, 6)]
+
+    return {
+        "GET /": lambda rng: ("GET", "/", None, None),
+        "GET /health": lambda rng: ("GET", "/health", None, None),
+        "GET /api/horoscope": lambda rng: (
+            "GET", "/api/horoscope", {"sign": rng.choice(SIGNS), "user_id": user(rng)}, None),
+        "GET /api/horoscope/matrix": lambda rng: (
+            "GET", "/api/horoscope/matrix", {"from": week[0], "to": week[1]}, None),
+        "POST /api/day-card": lambda rng: (
+            "POST", "/api/day-card", None, {"initData": init[user(rng)]}),
+        "POST /api/favorites": lambda rng: (
+            "POST", "/api/favorites", None,
+            {"initData": init[user(rng)], "type": "horoscope",
+             "content": {"sign": rng.choice(SIGNS), "text": f"Гороскоп #{rng.randint(1, 200)}"}}),
+        "GET /api/favorites": lambda rng: (
+            "GET", "/api/favorites", {"init_data": init[user(rng)], "limit": 20}, None),
+        "GET /api/favorites?summary": lambda rng: (
+            "GET", "/api/favorites", {"init_data": init[user(rng)], "summary": "true"}, None),
+        "POST /api/user/settings": lambda rng: (
+            "POST", "/api/user/settings", None,
+            {"initData": init[user(rng)],
+             "settings": {"zodiac_sign": rng.choice(SIGNS), "birth_time": "12:00", "notification_time": None}}),
+        "GET /api/user/settings": lambda rng: (
+            "GET", "/api/user/settings", {"init_data": init[user(rng)]}, None),
+        "POST /api/bootstrap": lambda rng: (
+            "POST", "/api/bootstrap", None, {"initData": init[user(rng)], "sign": rng.choice(SIGNS)}),
+        "GET /api/analytics/user": lambda rng: (
+            "GET", "/api/analytics/user", {"init_data": init[user(rng)]}, None),
+        "POST /api/horoscope/premium": lambda rng: (
+            "POST", "/api/horoscope/premium", None, {"initData": init[user(rng)], "sign": rng.choice(SIGNS)}),
+        "POST /api/share": lambda rng: (
+            "POST", "/api/share", None,
+            {"initData": init[user(rng)], "content_type": "horoscope",
+             "content": {"sign": rng.choice(SIGNS), "text": "Поделюсь гороскопом"}, "share_text": "Мой гороскоп"}),
+        "GET /api/shared/{id}": lambda rng: ("GET", f"/api/shared/{rng.choice(shares)}", None, None),
+    }
+
+
+def percentile(samples: List[float], p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+
+async def run_endpoint(client: httpx.AsyncClient, make_request: Callable[[random.Random], Request],
+                       total: int, concurrency: int, rng: random.Random) -> Dict:
+    """Выполнить total запросов конкурентно; собрать задержки и ошибки"""
+    requests = [make_request(rng) for _ in range(total)]
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    queue = iter(requests)
+
+    async def worker():
+        for method, path, params, body in queue:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, params=params, json=body)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": round(total / elapsed, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+async def run_suite(client: httpx.AsyncClient, scenarios: Dict, args, label: str) -> Dict:
+    rng = random.Random(args.seed)
+    # Прогрев: кеши, подготовленные запросы, соединения
+    for make_request in scenarios.values():
+        method, path, params, body = make_request(rng)
+        await client.request(method, path, params=params, json=body)
+
+    results = {}
+    print(f"\n🏁 {label}: {args.requests} запросов на эндпоинт, конкурентность {args.concurrency}")
+    print(f"   {'эндпоинт':<30} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'ошибки':>7}")
+    for name, make_request in scenarios.items():
+        result = await run_endpoint(client, make_request, args.requests, args.concurrency, rng)
+        results[name] = result
+        print(f"   {name:<30} {result['throughput_rps']:>9} {result['p50_ms']:>9} {result['p95_ms']:>9} "
+              f"{result['p99_ms']:>9} {sum(result['errors'].values()):>7}")
+    return results
+
+
+async def bench_asgi(scenarios: Dict, args, db_path: str) -> Dict:
+    """In-process: запросы идут в приложение напрямую, без сети; lifespan запускается вручную"""
+    import main
+
+    # db_pool создан при импорте модулей для наполнения и смотрит на seed.db: переключаем на копию до открытия
+    main.db_pool.path = db_path
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            return await run_suite(client, scenarios, args, "ASGI (in-process)")
+
+
+async def bench_uvicorn(scenarios: Dict, args, env: Dict[str, str]) -> Dict:
+    """Настоящий сервер uvicorn в отдельном процессе, запросы по HTTP через loopback"""
+    base_url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env
+    )
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+            deadline = time.monotonic() + 30
+            while True:
+                try:
+                    if (await client.get("/health")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("uvicorn не запустился")
+                await asyncio.sleep(0.2)
+            return await run_suite(client, scenarios, args, f"uvicorn ({args.workers} воркер.)")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк API Гнома Гороскопа")
+    parser.add_argument("--users", type=int, default=200, help="синтетических пользователей")
+    parser.add_argument("--requests", type=int, default=500, help="запросов на эндпоинт")
+    parser.add_argument("--concurrency", type=int, default=32, help="одновременных запросов")
+    parser.add_argument("--mode", choices=["asgi", "uvicorn", "both"], default="both")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="horoscope-bench-")
+    seed_path = os.path.join(workdir, "seed.db")
+    # Окружение задаётся до импорта модулей приложения: они читают настройки при импорте
+    env = {
+        "BOT_TOKEN": BENCH_BOT_TOKEN,
+        "ARCHIVE_DIR": os.path.join(workdir, "archive"),
+        "TELEGRAM_API_BASE": "http://127.0.0.1:9",  # никаких запросов к настоящему Telegram
+    }
+    os.environ.update(env)
+    os.environ["DATABASE_PATH"] = seed_path
+    sys.path.insert(0, BACKEND_DIR)
+
+    try:
+        started = time.perf_counter()
+        data = seed_database(seed_path, args.users, random.Random(args.seed))
+        print(f"🌱 Данные: {args.users} пользователей, {len(data['share_ids'])} репостов, "
+              f"{os.path.getsize(seed_path) // 1024} КиБ, {time.perf_counter() - started:.1f} с")
+        scenarios = build_scenarios(data)
+
+        results = {}
+        # Каждый режим работает со своей копией исходной БД; копии снимаются до первого прогона
+        asgi_db = os.path.join(workdir, "asgi.db")
+        uvicorn_db = os.path.join(workdir, "uvicorn.db")
+        shutil.copyfile(seed_path, asgi_db)
+        shutil.copyfile(seed_path, uvicorn_db)
+        if args.mode in ("asgi", "both"):
+            results["asgi"] = asyncio.run(bench_asgi(scenarios, args, asgi_db))
+        if args.mode in ("uvicorn", "both"):
+            server_env = {**os.environ, "DATABASE_PATH": uvicorn_db}
+            results["uvicorn"] = asyncio.run(bench_uvicorn(scenarios, args, server_env))
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "users": args.users,
+                "requests_per_endpoint": args.requests,
+                "concurrency": args.concurrency,
+                "workers": args.workers,
+                "seed": args.seed,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.output}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
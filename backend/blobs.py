@@ -0,0 +1,35 @@
+import json
+import hashlib
+import sqlite3
+from typing import Any
+
+
+def canonical_content(content: Any) -> str:
+    """Каноническая сериализация: одинаковый контент даёт одинаковую строку независимо от порядка ключей"""
+    return json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def content_hash(body: str) -> bytes:
+    return hashlib.sha256(body.encode("utf-8")).digest()
+
+
+def store_body(conn: sqlite3.Connection, body: str) -> int:
+    """id блоба с данным каноническим содержимым; новый блоб создаётся с refcount=0
+
+    Счётчик ссылок увеличивают триггеры при вставке строки, ссылающейся на блоб,
+    поэтому вызов и вставка ссылки должны выполняться в одной транзакции.
+    """
+    digest = content_hash(body)
+    conn.execute("INSERT INTO content_blobs(hash, body) VALUES(?,?) ON CONFLICT(hash) DO NOTHING", (digest, body))
+    return conn.execute("SELECT id FROM content_blobs WHERE hash=?", (digest,)).fetchone()[0]
+
+
+def store_content(conn: sqlite3.Connection, content: Any) -> int:
+    return store_body(conn, canonical_content(content))
+
+
+def collect_blobs(conn: sqlite3.Connection) -> int:
+    """Удалить блобы, на которые больше нет ссылок"""
+    cur = conn.execute("DELETE FROM content_blobs WHERE refcount <= 0")
+    conn.commit()
+    return cur.rowcount
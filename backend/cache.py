@@ -0,0 +1,69 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Hashable, Optional
+
+
+def next_utc_midnight() -> float:
+    """Момент ближайшей смены суток по UTC (unix time)"""
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight.timestamp()
+
+
+class TTLCache:
+    """Ограниченный in-memory кеш: LRU-вытеснение и истечение записей по сроку"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Значение по ключу или None, если записи нет или она истекла"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, expires_at: Optional[float] = None):
+        """Сохранить значение; по умолчанию запись живёт до смены суток по UTC"""
+        if expires_at is None:
+            expires_at = next_utc_midnight()
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict:
+        return {
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,167 @@
+import json
+import sqlite3
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from blobs import store_content
+
+# Запросы обработчиков API к таблицам приложения. Функции принимают соединение первым
+# аргументом и не фиксируют транзакцию: их вызывают через database.read / database.write.
+
+
+# daily_cache
+
+def get_daily_text(conn: sqlite3.Connection, sign: str, date: str) -> Optional[str]:
+    row = conn.execute("SELECT text FROM daily_cache WHERE sign=? AND date=?", (sign, date)).fetchone()
+    return row[0] if row else None
+
+
+def put_daily_text(conn: sqlite3.Connection, sign: str, date: str, text: str, created_at: str):
+    conn.execute(
+        "INSERT OR REPLACE INTO daily_cache(sign, date, text, created_at) VALUES(?,?,?,?)",
+        (sign, date, text, created_at)
+    )
+
+
+def get_daily_range(conn: sqlite3.Connection, signs: Sequence[str], date_from: str,
+                    date_to: str) -> List[Tuple[str, str, str]]:
+    """Сохранённые гороскопы знаков за диапазон дат одним запросом по индексу (sign, date)"""
+    return conn.execute(
+        f"SELECT sign, date, text FROM daily_cache "
+        f"WHERE sign IN ({','.join('?' * len(signs))}) AND date BETWEEN ? AND ?",
+        (*signs, date_from, date_to)
+    ).fetchall()
+
+
+# day_cards
+
+def get_day_card_state(conn: sqlite3.Connection, user_id: int, date: str) -> Tuple[Optional[tuple], int]:
+    """Сохранённая карта на дату (если есть) и число событий get_day_card за этот день"""
+    row = conn.execute(
+        "SELECT card_title, card_text FROM day_cards WHERE user_id=? AND date=?", (user_id, date)
+    ).fetchone()
+    shown = conn.execute(
+        "SELECT count FROM user_action_daily WHERE user_id=? AND day=? AND action='get_day_card'", (user_id, date)
+    ).fetchone()
+    return row, shown[0] if shown else 0
+
+
+# favorites
+
+def add_favorite(conn: sqlite3.Connection, user_id: int, content_type: str, content: Any, added_at: str):
+    conn.execute(
+        "INSERT INTO favorites(user_id, content_type, content_id, added_at) VALUES(?,?,?,?)",
+        (user_id, content_type, store_content(conn, content), added_at)
+    )
+
+
+def favorites_summary(conn: sqlite3.Connection, user_id: int) -> Dict[str, int]:
+    """Число избранного по типам; считается по индексу, без чтения содержимого"""
+    rows = conn.execute(
+        "SELECT content_type, COUNT(*) FROM favorites WHERE user_id=? GROUP BY content_type", (user_id,)
+    ).fetchall()
+    return dict(rows)
+
+
+def favorites_page(conn: sqlite3.Connection, user_id: int, limit: int,
+                   before: Optional[Tuple[str, int]] = None) -> List[Tuple[int, str, str, str]]:
+    """Строки (id, тип, JSON содержимого, added_at) от новых к старым, строго до позиции before"""
+    if before:
+        return conn.execute(
+            "SELECT f.id, f.content_type, b.body, f.added_at FROM favorites f "
+            "JOIN content_blobs b ON b.id = f.content_id "
+            "WHERE f.user_id=? AND (f.added_at, f.id) < (?, ?) ORDER BY f.added_at DESC, f.id DESC LIMIT ?",
+            (user_id, before[0], before[1], limit)
+        ).fetchall()
+    return conn.execute(
+        "SELECT f.id, f.content_type, b.body, f.added_at FROM favorites f "
+        "JOIN content_blobs b ON b.id = f.content_id "
+        "WHERE f.user_id=? ORDER BY f.added_at DESC, f.id DESC LIMIT ?",
+        (user_id, limit)
+    ).fetchall()
+
+
+# user_settings
+
+def save_user_settings(conn: sqlite3.Connection, user_id: int, settings: Dict, now: str):
+    conn.execute("""
+        INSERT OR REPLACE INTO user_settings
+        (user_id, zodiac_sign, birth_time, birth_location, notification_time,
+         premium, language, theme, timezone, created_at, updated_at)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?)
+    """, (
+        user_id,
+        settings.get("zodiac_sign"),
+        settings.get("birth_time"),
+        settings.get("birth_location"),
+        settings.get("notification_time", "09:00"),
+        settings.get("premium", False),
+        settings.get("language", "ru"),
+        settings.get("theme", "light"),
+        settings.get("timezone", "UTC"),
+        now,
+        now
+    ))
+
+
+def get_user_settings(conn: sqlite3.Connection, user_id: int) -> Optional[tuple]:
+    return conn.execute("""
+        SELECT zodiac_sign, birth_time, birth_location, notification_time,
+               premium, language, theme, created_at, timezone
+        FROM user_settings WHERE user_id=?
+    """, (user_id,)).fetchone()
+
+
+def get_birth_data(conn: sqlite3.Connection, user_id: int) -> Tuple[Optional[str], Optional[str]]:
+    row = conn.execute("SELECT birth_time, birth_location FROM user_settings WHERE user_id=?", (user_id,)).fetchone()
+    return (row[0], row[1]) if row else (None, None)
+
+
+# user_analytics (агрегаты)
+
+def get_user_analytics(conn: sqlite3.Connection, user_id: int, recent_limit: int) -> Tuple[Dict[str, int], List[Dict]]:
+    """Счётчики действий и последние события пользователя из агрегатов, а не из полного журнала"""
+    action_stats = {row[0]: row[1] for row in conn.execute("""
+        SELECT action, count
+        FROM user_action_counts
+        WHERE user_id=?
+        ORDER BY count DESC
+    """, (user_id,))}
+    recent_actions = [{
+        "action": row[0],
+        "data": json.loads(row[1]) if row[1] else None,
+        "timestamp": row[2]
+    } for row in conn.execute("""
+        SELECT action, data, timestamp
+        FROM user_recent_actions
+        WHERE user_id=?
+        ORDER BY id DESC
+        LIMIT ?
+    """, (user_id, recent_limit))]
+    return action_stats, recent_actions
+
+
+# shared_content
+
+def add_shared_content(conn: sqlite3.Connection, user_id: int, content_type: str, content: Any,
+                       share_text: str, created_at: str) -> int:
+    cur = conn.execute("""
+        INSERT INTO shared_content
+        (user_id, content_type, content_id, share_text, created_at)
+        VALUES (?,?,?,?,?)
+    """, (user_id, content_type, store_content(conn, content), share_text, created_at))
+    return cur.lastrowid
+
+
+def get_shared_content(conn: sqlite3.Connection, share_id: int) -> Optional[tuple]:
+    return conn.execute("""
+        SELECT s.content_type, b.body, s.share_text, s.share_count, s.created_at
+        FROM shared_content s JOIN content_blobs b ON b.id = s.content_id
+        WHERE s.id=?
+    """, (share_id,)).fetchone()
+
+
+def add_share_views(conn: sqlite3.Connection, increments: Dict[int, int]):
+    conn.executemany(
+        "UPDATE shared_content SET share_count = share_count + ? WHERE id=?",
+        [(count, share_id) for share_id, count in increments.items()]
+    )
@@ -0,0 +1,210 @@
+import os
+import time
+import queue
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from migrations import run_migrations
+from metrics import record_db_operation
+
+# Настройки базы данных
+DATABASE_PATH = os.getenv("DATABASE_PATH", "database.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # секунд ожидания свободного соединения
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KIB = int(os.getenv("DB_CACHE_SIZE_KIB", "16384"))  # страничный кеш на соединение
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(128 * 1024 * 1024)))
+DB_READ_THREADS = int(os.getenv("DB_READ_THREADS", "4"))  # потоков чтения для обработчиков запросов
+# Однократный перевод существующей БД в auto_vacuum=INCREMENTAL полным VACUUM при старте.
+# VACUUM блокирует базу целиком: включать на один запуск с одним воркером
+DB_CONVERT_INCREMENTAL_VACUUM = os.getenv("DB_CONVERT_INCREMENTAL_VACUUM", "0") == "1"
+
+
+def connect(path: str = DATABASE_PATH) -> sqlite3.Connection:
+    """Открыть соединение, настроенное для конкурентной нагрузки"""
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+    # Действует только для новой БД (до создания таблиц); существующую переводит ensure_incremental_vacuum
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    return conn
+
+
+def ensure_incremental_vacuum(conn: sqlite3.Connection) -> bool:
+    """Режим auto_vacuum=INCREMENTAL; существующая БД переводится полным VACUUM только по DB_CONVERT_INCREMENTAL_VACUUM"""
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return True
+    if not DB_CONVERT_INCREMENTAL_VACUUM:
+        print("ℹ️ База данных не в режиме incremental vacuum: ротация не будет возвращать место ОС "
+              "(однократный перевод: DB_CONVERT_INCREMENTAL_VACUUM=1)")
+        return False
+    print("🧹 Перевод базы данных в режим incremental vacuum...")
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+
+class ConnectionPool:
+    """Пул долгоживущих SQLite соединений, создаётся один раз при старте приложения"""
+
+    def __init__(self, path: str = DATABASE_PATH, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.schema_version = 0
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all = []
+
+    @property
+    def is_open(self) -> bool:
+        return bool(self._all)
+
+    def open(self):
+        """Открыть соединения и применить миграции схемы"""
+        if self.is_open:
+            return
+        for _ in range(self.size):
+            conn = connect(self.path)
+            self._all.append(conn)
+            self._idle.put(conn)
+        with self.connection() as conn:
+            self.schema_version = run_migrations(conn)
+            # До начала обслуживания запросов: VACUUM держит блокировку дольше busy_timeout
+            ensure_incremental_vacuum(conn)
+
+    def close(self):
+        """Закрыть все соединения пула"""
+        for conn in self._all:
+            try:
+                conn.close()
+            except Exception as e:
+                print(f"Ошибка закрытия соединения: {e}")
+        self._all = []
+        self._idle = queue.LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        """Взять соединение из пула на время блока"""
+        if not self.is_open:
+            raise RuntimeError("Пул соединений не инициализирован")
+        try:
+            conn = self._idle.get(timeout=DB_POOL_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError("Нет свободных соединений с базой данных")
+        try:
+            yield conn
+        finally:
+            # Незавершённая транзакция не должна перейти к следующему запросу
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put(conn)
+
+
+class AsyncDatabase:
+    """Асинхронный доступ к БД для обработчиков запросов: SQLite не вызывается в потоке event loop
+
+    Чтения выполняются ограниченным пулом потоков на соединениях пула, записи обработчиков -
+    одним потоком-писателем со своим соединением: они идут по очереди между собой, а commit
+    (fsync) не останавливает обработку остальных запросов. Фоновые задачи (буфер аналитики,
+    outbox, планировщик, прогрев, ротация) пишут через соединения пула в своих потоках,
+    поэтому блокировку записи SQLite писатель делит с ними и ждёт её в пределах busy_timeout.
+    Функции получают соединение первым аргументом; write фиксирует транзакцию сам.
+    """
+
+    def __init__(self, pool: ConnectionPool, read_threads: int = DB_READ_THREADS):
+        self.pool = pool
+        self.read_threads = read_threads
+        self._readers: Optional[ThreadPoolExecutor] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self.reads = 0
+        self.writes = 0
+        self.errors = 0
+        self.pending_writes = 0
+        self.read_seconds = 0.0
+        self.write_seconds = 0.0
+
+    def start(self):
+        """Запустить потоки чтения и писателя (пул соединений уже открыт)"""
+        if self._writer is None:
+            self._readers = ThreadPoolExecutor(self.read_threads, thread_name_prefix="db-read")
+            self._writer = ThreadPoolExecutor(1, thread_name_prefix="db-write")
+            self._writer_conn = connect(self.pool.path)
+
+    def close(self):
+        """Дождаться поставленных операций и остановить потоки"""
+        if self._writer is not None:
+            self._readers.shutdown(wait=True)
+            self._writer.shutdown(wait=True)
+            self._writer_conn.close()
+            self._readers = self._writer = self._writer_conn = None
+
+    # Рабочие потоки возвращают время выполнения, учёт ведётся уже в потоке event loop
+
+    def _read(self, fn: Callable, args: tuple) -> Tuple[Any, float]:
+        started = time.perf_counter()
+        with self.pool.connection() as conn:
+            return fn(conn, *args), time.perf_counter() - started
+
+    def _write(self, fn: Callable, args: tuple) -> Tuple[Any, float]:
+        started = time.perf_counter()
+        conn = self._writer_conn
+        try:
+            result = fn(conn, *args)
+            conn.commit()
+            return result, time.perf_counter() - started
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    async def read(self, fn: Callable, *args) -> Any:
+        """Выполнить fn(conn, *args) в потоке чтения"""
+        if self._readers is None:
+            raise RuntimeError("Доступ к базе данных не инициализирован")
+        self.reads += 1
+        try:
+            result, elapsed = await asyncio.get_running_loop().run_in_executor(self._readers, self._read, fn, args)
+        except Exception:
+            self.errors += 1
+            raise
+        self.read_seconds += elapsed
+        record_db_operation("read", elapsed)
+        return result
+
+    async def write(self, fn: Callable, *args) -> Any:
+        """Выполнить fn(conn, *args) в потоке-писателе и зафиксировать транзакцию"""
+        if self._writer is None:
+            raise RuntimeError("Доступ к базе данных не инициализирован")
+        self.writes += 1
+        self.pending_writes += 1
+        try:
+            result, elapsed = await asyncio.get_running_loop().run_in_executor(self._writer, self._write, fn, args)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.pending_writes -= 1
+        self.write_seconds += elapsed
+        record_db_operation("write", elapsed)
+        return result
+
+    def stats(self) -> Dict:
+        return {
+            "reads": self.reads,
+            "writes": self.writes,
+            "errors": self.errors,
+            "pending_writes": self.pending_writes,
+            "avg_read_ms": round(self.read_seconds / self.reads * 1000, 3) if self.reads else None,
+            "avg_write_ms": round(self.write_seconds / self.writes * 1000, 3) if self.writes else None,
+        }
+
+
+db_pool = ConnectionPool()
+database = AsyncDatabase(db_pool)
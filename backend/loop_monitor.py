@@ -0,0 +1,60 @@
+import os
+import asyncio
+from collections import deque
+from typing import Dict, Optional
+
+# Настройки измерения задержки event loop
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))  # секунд между замерами
+LOOP_LAG_WINDOW = int(os.getenv("LOOP_LAG_WINDOW", "600"))  # замеров в окне статистики (~1 минута)
+
+
+class LoopLagMonitor:
+    """Задержка event loop: насколько позже запланированного просыпается периодическая задача
+
+    Любой блокирующий вызов в потоке цикла (например, синхронный запрос к SQLite)
+    напрямую увеличивает задержку, поэтому метрика показывает, свободен ли цикл.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL, window: int = LOOP_LAG_WINDOW):
+        self.interval = interval
+        self._samples = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag = 0.0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._samples.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0}
+
+        def percentile(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))] * 1000, 3)
+
+        return {
+            "samples": len(samples),
+            "p50_ms": percentile(0.50),
+            "p99_ms": percentile(0.99),
+            "window_max_ms": round(samples[-1] * 1000, 3),
+            "max_ms": round(self.max_lag * 1000, 3),
+        }
@@ -1,26 +1,93 @@
 import os
-import sqlite3
 import json
 import hashlib
 import hmac
 import time
 import random
-import requests
+import base64
 from datetime import datetime, timezone, timedelta
-from urllib.parse import unquote, parse_qs
-from typing import Optional, List, Dict, Any
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from typing import Optional, List, Dict, Any, Tuple
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Query, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
 import asyncio
 
+from db import db_pool, database, DATABASE_PATH
+from analytics import analytics_buffer, RECENT_ACTIONS_LIMIT
+from providers import create_provider
+from singleflight import SingleFlight
+from cache import TTLCache, next_utc_midnight
+from prewarm import PrewarmScheduler
+from telegram_auth import InitDataVerifier, InitDataExpired
+from notifications import TelegramSender
+from outbox import NotificationOutbox
+from scheduler import NotificationScheduler
+from retention import RetentionJob
+from shares import ShareViews
+from loop_monitor import LoopLagMonitor
+from metrics import registry, MetricsMiddleware, horoscope_lookups, provider_duration, provider_requests
+from profiling import PROFILING_ENABLED, PROFILE_SECRET, PROFILE_SAMPLE_RATE, ProfileStore, ProfilingMiddleware, secret_matches
+import dal
+
 # Настройки
 BOT_TOKEN = os.getenv("BOT_TOKEN", "8314608234:AAFQUNz63MECCtExqaKGqg02qm0GWv0Nbz4")  # Переместить в .env!
 FRONTEND_URL = os.getenv("FRONTEND_URL", "https://gilded-blancmange-ecc392.netlify.app")
 API_KEY_HOROSCOPE = os.getenv("API_KEY_HOROSCOPE", "")  # Для внешних API гороскопов
+HOROSCOPE_CACHE_SIZE = int(os.getenv("HOROSCOPE_CACHE_SIZE", "256"))  # записей (знак, дата) в памяти
+FAVORITES_PAGE_SIZE = int(os.getenv("FAVORITES_PAGE_SIZE", "50"))
+FAVORITES_MAX_PAGE_SIZE = int(os.getenv("FAVORITES_MAX_PAGE_SIZE", "200"))
+DAY_CARD_SECRET = os.getenv("DAY_CARD_SECRET", "")  # ключ выбора карты дня; по умолчанию производный от BOT_TOKEN
+PREMIUM_CACHE_SIZE = int(os.getenv("PREMIUM_CACHE_SIZE", "4096"))  # пользователей с готовым премиум-набором
+TEMPLATE_FALLBACK_TTL = int(os.getenv("TEMPLATE_FALLBACK_TTL", "300"))  # секунд до повторного запроса к API после сбоя
+MATRIX_MAX_CELLS = int(os.getenv("MATRIX_MAX_CELLS", "372"))  # знаков x дней в одном запросе матрицы (12 x 31)
+DAY_CARDS_SHOWN_SIZE = int(os.getenv("DAY_CARDS_SHOWN_SIZE", "65536"))  # (пользователь, дата) с уже показанной картой
+
+horoscope_provider = create_provider(API_KEY_HOROSCOPE)
+init_data_verifier = InitDataVerifier(BOT_TOKEN)
+telegram_sender = TelegramSender(BOT_TOKEN)
+horoscope_flight = SingleFlight()  # одновременные промахи daily_cache по (знак, дата)
+horoscope_memory = TTLCache(HOROSCOPE_CACHE_SIZE)  # уровень кеша в памяти перед daily_cache
+premium_cache = TTLCache(PREMIUM_CACHE_SIZE)  # user_id -> (отпечаток, ответ) до конца суток UTC
+day_cards_shown = TTLCache(DAY_CARDS_SHOWN_SIZE)  # (user_id, дата) -> True до конца суток UTC
+loop_lag = LoopLagMonitor()
+profile_store = ProfileStore()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Инициализация общих ресурсов при старте и их освобождение при остановке"""
+    print("📊 Инициализация базы данных...")
+    db_pool.open()
+    print(f"✅ База данных готова ({db_pool.path}, схема v{db_pool.schema_version}, соединений: {db_pool.size})")
+    database.start()
+    loop_lag.start()
+    analytics_buffer.start()
+    await horoscope_provider.start()
+    await telegram_sender.start()
+    if horoscope_provider.enabled:
+        # Шаблонные гороскопы считаются на лету, прогревать нечего
+        prewarm_scheduler.start()
+    notification_outbox.start()
+    notification_scheduler.start()
+    retention_job.start()
+    share_views.start()
+    try:
+        yield
+    finally:
+        await share_views.stop()
+        await retention_job.stop()
+        await notification_scheduler.stop()
+        await notification_outbox.stop()
+        await prewarm_scheduler.stop()
+        await telegram_sender.close()
+        await horoscope_provider.close()
+        await analytics_buffer.stop()
+        await loop_lag.stop()
+        database.close()
+        db_pool.close()
 
-app = FastAPI(title="Gnome Horoscope API", version="2.0.0")
+app = FastAPI(title="Gnome Horoscope API", version="2.0.0", lifespan=lifespan)
 
 # Pydantic модели
 class UserSettings(BaseModel):
@@ -32,6 +99,7 @@ class UserSettings(BaseModel):
     premium: bool = False
     language: str = "ru"
     theme: str = "light"
+    timezone: str = "UTC"
 
 # CORS для фронтенда
 app.add_middleware(
@@ -46,6 +114,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Профилирование только по настройке: выключенное не добавляет в цепочку ни одного вызова
+if PROFILING_ENABLED:
+    if not PROFILE_SECRET:
+        print("⚠️ PROFILE_SECRET не задан: профили собираются только по выборке и недоступны для скачивания")
+    print(f"🔬 Профилирование запросов включено (выборка: {PROFILE_SAMPLE_RATE})")
+    app.add_middleware(ProfilingMiddleware, store=profile_store)
+
+# Метрики по шаблону маршрута; снаружи CORS, чтобы учитывать и preflight-запросы.
+# Добавляется последним, чтобы профилирование видело время SQLite текущего запроса
+app.add_middleware(MetricsMiddleware, routes=app.routes)
+
 # Маппинг знаков зодиака
 ZODIAC_MAP = {
     "Овен": "aries", "Телец": "taurus", "Близнецы": "gemini", "Рак": "cancer",
@@ -82,168 +161,113 @@ DAY_CARDS = [
     {"название": "Гном-мастер", "совет": "Руки помнят мудрость. Займитесь любимым делом или освойте новый навык."}
 ]
 
-def get_db():
-    """Инициализация базы данных с расширенными таблицами для новых функций"""
-    db_path = "database.db"
-    conn = sqlite3.connect(db_path)
-    
-    # Основные таблицы
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS daily_cache (
-            id INTEGER PRIMARY KEY,
-            sign TEXT NOT NULL,
-            date TEXT NOT NULL,
-            text TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            UNIQUE(sign, date)
-        )
-    """)
-    
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS day_cards (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            card_title TEXT NOT NULL,
-            card_text TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            UNIQUE(user_id, date)
-        )
-    """)
-    
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS favorites (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            content_type TEXT NOT NULL,
-            content TEXT NOT NULL,
-            added_at TEXT NOT NULL
-        )
-    """)
-    
-    # Новые таблицы для расширенного функционала
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS user_settings (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER UNIQUE NOT NULL,
-            zodiac_sign TEXT,
-            birth_time TEXT,
-            birth_location TEXT,
-            notification_time TEXT DEFAULT '09:00',
-            premium INTEGER DEFAULT 0,
-            language TEXT DEFAULT 'ru',
-            theme TEXT DEFAULT 'light',
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL
-        )
-    """)
-    
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS user_analytics (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            action TEXT NOT NULL,
-            data TEXT,
-            timestamp TEXT NOT NULL
-        )
-    """)
-    
-    conn.execute("""
-        CREATE TABLE IF NOT EXISTS shared_content (
-            id INTEGER PRIMARY KEY,
-            user_id INTEGER NOT NULL,
-            content_type TEXT NOT NULL,
-            content TEXT NOT NULL,
-            share_text TEXT NOT NULL,
-            share_count INTEGER DEFAULT 0,
-            created_at TEXT NOT NULL
-        )
-    """)
-    
-    return conn
-
 def verify_telegram_data(init_data: str) -> Optional[dict]:
-    """Проверка подлинности данных Telegram WebApp"""
+    """Проверка подлинности данных Telegram WebApp; 401, если сессия Mini App устарела"""
     try:
-        parsed_data = parse_qs(init_data)
-        received_hash = parsed_data.get('hash', [''])[0]
-        if not received_hash:
-            return None
-            
-        data_to_check = []
-        for key, value in parsed_data.items():
-            if key != 'hash':
-                data_to_check.append(f"{key}={value[0]}")
-        
-        data_string = '\n'.join(sorted(data_to_check))
-        secret_key = hmac.new(b"WebAppData", BOT_TOKEN.encode(), hashlib.sha256).digest()
-        calculated_hash = hmac.new(secret_key, data_string.encode(), hashlib.sha256).hexdigest()
-        
-        if calculated_hash == received_hash:
-            user_data = parsed_data.get('user', [''])[0]
-            if user_data:
-                user = json.loads(unquote(user_data))
-                return user
-                
-    except Exception as e:
-        print(f"Ошибка проверки Telegram данных: {e}")
-        
-    return None
+        return init_data_verifier.verify(init_data)
+    except InitDataExpired:
+        raise HTTPException(status_code=401, detail="Сессия Telegram устарела, перезапустите приложение")
 
 def today_key():
     """Получить ключ для текущего дня"""
     return datetime.now(timezone.utc).strftime("%Y-%m-%d")
 
+retention_job = RetentionJob(db_pool)
+share_views = ShareViews(database)
+
 def log_user_action(user_id: int, action: str, data: Optional[Dict] = None):
-    """Логирование действий пользователя для аналитики"""
+    """Логирование действий пользователя для аналитики (через буфер, без записи в БД на запросе)"""
+    analytics_buffer.record(user_id, action, data)
+
+def stable_seed(*parts: Any) -> int:
+    """Зерно генератора, одинаковое во всех процессах (в отличие от hash() при PYTHONHASHSEED)"""
+    digest = hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+def template_horoscope(sign: str, date: str, language: str = "ru") -> str:
+    """Локальный гороскоп из шаблонов; зависит только от (знак, дата, язык), БД не нужна"""
+    return HOROSCOPE_TEMPLATES[stable_seed(sign, date, language) % len(HOROSCOPE_TEMPLATES)]
+
+def provider_day(date: str) -> Optional[str]:
+    """День запроса к внешнему API относительно текущей даты; None, если API эту дату не отдаёт"""
+    today = datetime.now(timezone.utc).date()
+    offsets = {-1: "yesterday", 0: "today", 1: "tomorrow"}
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO user_analytics(user_id, action, data, timestamp) VALUES(?,?,?,?)",
-            (user_id, action, json.dumps(data) if data else None, datetime.now(timezone.utc).isoformat())
-        )
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Ошибка логирования: {e}")
+        return offsets.get((datetime.strptime(date, "%Y-%m-%d").date() - today).days)
+    except ValueError:
+        return None
 
-async def get_real_horoscope_data(sign: str, date: Optional[str] = None) -> str:
-    """Получение актуальных данных о гороскопе через внешние API"""
-    if not API_KEY_HOROSCOPE:
-        seed = hash(f"{sign}{date or today_key()}") % len(HOROSCOPE_TEMPLATES)
-        return HOROSCOPE_TEMPLATES[seed]
+async def fetch_horoscope_text(sign: str, date: str) -> Optional[str]:
+    """Текст гороскопа из внешнего API; None, если API отключен, недоступен или не отдаёт эту дату"""
+    day = provider_day(date)
+    if not horoscope_provider.enabled or day is None:
+        # Иначе API вернул бы сегодняшний текст, и он навсегда остался бы в daily_cache под чужой датой
+        return None
     
-    try:
-        english_sign = ZODIAC_MAP.get(sign, sign.lower())
-        response = requests.post(
-            "https://aztro.sameerkumar.website/",
-            params={"sign": english_sign, "day": "today"},
-            timeout=5
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            english_text = data.get("description", "")
-            if english_text:
-                return f"Гномы читают звезды: {english_text}"
-    except Exception as e:
-        print(f"Ошибка получения реальных данных: {e}")
+    english_sign = ZODIAC_MAP.get(sign, sign.lower())
+    started = time.perf_counter()
+    english_text = await horoscope_provider.fetch(english_sign, day)
+    provider_duration.observe(time.perf_counter() - started, horoscope_provider.name)
+    provider_requests.inc(horoscope_provider.name, "ok" if english_text else "error")
+    if english_text:
+        return f"Гномы читают звезды: {english_text}"
+    return None
+
+async def fill_daily_cache(sign: str, date: str) -> Tuple[str, str]:
+    """Получить гороскоп из API и сохранить его в daily_cache (вызывается через single-flight)"""
+    # Запрос, промахнувшийся мимо кеша до записи предыдущего лидера, но пришедший после его
+    # завершения, открывает новый полёт: проверяем оба уровня ещё раз, прежде чем идти в API
+    text = horoscope_memory.get((sign, date))
+    if text is not None:
+        return text, "memory"
+    text = await database.read(dal.get_daily_text, sign, date)
+    if text is not None:
+        horoscope_memory.set((sign, date), text)
+        return text, "cache"
+    
+    horoscope_text = await fetch_horoscope_text(sign, date)
+    if horoscope_text is None:
+        # Шаблон не пишется в daily_cache: он воспроизводим, а API стоит повторить позже
+        horoscope_text = template_horoscope(sign, date)
+        horoscope_memory.set((sign, date), horoscope_text, expires_at=time.time() + TEMPLATE_FALLBACK_TTL)
+        return horoscope_text, "template"
+    
+    # Соединение не удерживается на время обращения к внешнему API
+    await database.write(dal.put_daily_text, sign, date, horoscope_text, datetime.now(timezone.utc).isoformat())
+    horoscope_memory.set((sign, date), horoscope_text)
+    return horoscope_text, "real_api"
+
+async def get_cached_horoscope(sign: str, date: str) -> Tuple[str, str]:
+    """Гороскоп через уровни кеша: память -> daily_cache -> генерация; возвращает (текст, источник)"""
+    if not horoscope_provider.enabled:
+        # Без внешнего API текст детерминирован: любой воркер считает его сам, без БД и кешей
+        return template_horoscope(sign, date), "template"
+    
+    text = horoscope_memory.get((sign, date))
+    if text is not None:
+        return text, "memory"
+    
+    text = await database.read(dal.get_daily_text, sign, date)
+    if text is not None:
+        horoscope_memory.set((sign, date), text)
+        return text, "cache"
     
-    seed = hash(f"{sign}{date or today_key()}") % len(HOROSCOPE_TEMPLATES)
-    return HOROSCOPE_TEMPLATES[seed]
+    return await horoscope_flight.do((sign, date), lambda: fill_daily_cache(sign, date))
 
-def generate_premium_horoscope(sign: str, birth_time: Optional[str] = None, location: Optional[str] = None) -> Dict:
-    """Генерация расширенного премиум гороскопа"""
-    base_horoscope = HOROSCOPE_TEMPLATES[hash(sign + today_key()) % len(HOROSCOPE_TEMPLATES)]
+def generate_premium_horoscope(sign: str, birth_time: Optional[str] = None, location: Optional[str] = None,
+                               user_id: Optional[int] = None, date: Optional[str] = None) -> Dict:
+    """Генерация расширенного премиум гороскопа; счастливые числа и цвет постоянны в течение дня"""
+    date = date or today_key()
+    base_horoscope = template_horoscope(sign, date)
+    lucky = random.Random(stable_seed("premium", user_id, sign, date, birth_time, location))
     
     premium_aspects = {
         "detailed_forecast": base_horoscope,
         "love_compatibility": f"Сегодня ваша энергия привлечет нужных людей. Лучшая совместимость с знаками Огня.",
         "career_advice": "Профессиональные возможности открываются через коммуникацию с коллегами.",
         "health_tips": "Обратите внимание на сон и питание - ваше тело нуждается в заботе.",
-        "lucky_numbers": [random.randint(1, 50) for _ in range(3)],
-        "lucky_colors": ["gold", "emerald", "sapphire"][random.randint(0, 2)],
+        "lucky_numbers": [lucky.randint(1, 50) for _ in range(3)],
+        "lucky_colors": ["gold", "emerald", "sapphire"][lucky.randint(0, 2)],
         "moon_influence": "Луна в третьей четверти усиливает вашу интуицию."
     }
     
@@ -252,6 +276,15 @@ def generate_premium_horoscope(sign: str, birth_time: Optional[str] = None, loca
     
     return premium_aspects
 
+def remember_prewarmed(sign: str, date: str, text: str):
+    """Положить прогретый гороскоп в кеш памяти до конца его дня"""
+    expires_at = next_utc_midnight()
+    if date > today_key():
+        expires_at += 86400
+    horoscope_memory.set((sign, date), text, expires_at=expires_at)
+
+prewarm_scheduler = PrewarmScheduler(db_pool, ZODIAC_MAP, fetch_horoscope_text, remember_prewarmed)
+
 # API ENDPOINTS
 
 @app.get("/")
@@ -265,10 +298,12 @@ async def root():
         "endpoints": {
             "basic": [
                 "GET /health - Health check",
+                "GET /metrics - Prometheus metrics",
                 "GET /api/horoscope?sign=<sign> - Get horoscope",
+                "GET /api/horoscope/matrix?signs=&from=&to= - Horoscopes for several signs and dates",
                 "POST /api/day-card - Get daily card",
                 "POST /api/favorites - Add to favorites",
-                "GET /api/favorites - Get favorites"
+                "GET /api/favorites?limit=&before=&summary= - Get favorites (paginated)"
             ],
             "enhanced": [
                 "POST /api/user/settings - Save user settings",
@@ -276,7 +311,8 @@ async def root():
                 "POST /api/horoscope/premium - Premium horoscope",
                 "POST /api/share - Share content",
                 "GET /api/shared/{id} - Get shared content",
-                "GET /api/analytics/user - User analytics"
+                "GET /api/analytics/user - User analytics",
+                "POST /api/bootstrap - Settings, horoscope, day card and favorites in one request"
             ]
         },
         "features": [
@@ -293,6 +329,7 @@ async def root():
 @app.get("/health")
 async def health():
     """Проверка работоспособности API"""
+    backlog = await asyncio.get_running_loop().run_in_executor(None, notification_outbox.backlog)
     return {
         "status": "ok", 
         "timestamp": datetime.now(timezone.utc).isoformat(),
@@ -305,12 +342,88 @@ async def health():
             "premium_horoscopes",
             "analytics",
             "real_data"
-        ]
+        ],
+        "analytics": analytics_buffer.stats(),
+        "provider": horoscope_provider.stats(),
+        "singleflight": horoscope_flight.stats(),
+        "database": database.stats(),
+        "event_loop": loop_lag.stats(),
+        "horoscope_cache": horoscope_memory.stats(),
+        "premium_cache": premium_cache.stats(),
+        "prewarm": prewarm_scheduler.last_run,
+        "init_data_cache": init_data_verifier.stats(),
+        "telegram": telegram_sender.stats(),
+        "notification_outbox": {**notification_outbox.stats(), "backlog": backlog},
+        "notification_scheduler": notification_scheduler.stats(),
+        "retention": retention_job.last_run,
+        "shared_views": share_views.stats()
     }
 
+registry.gauge("db_pending_writes", "Операции записи в очереди потока SQLite",
+               lambda: {(): database.pending_writes})
+def loop_lag_quantiles() -> Dict[Tuple[str, ...], float]:
+    stats = loop_lag.stats()
+    if not stats["samples"]:
+        return {}
+    return {("0.5",): stats["p50_ms"] / 1000, ("0.99",): stats["p99_ms"] / 1000}
+
+registry.gauge("event_loop_lag_seconds", "Задержка event loop за окно замеров", loop_lag_quantiles, ("quantile",))
+registry.gauge("analytics_queued_events", "События аналитики, ожидающие записи",
+               lambda: {(): analytics_buffer.stats()["queued"]})
+registry.gauge("shared_pending_views", "Просмотры шаринга, ещё не записанные в БД",
+               lambda: {(): share_views.stats()["pending_views"]})
+registry.gauge("horoscope_cache_entries", "Записей в кеше гороскопов в памяти",
+               lambda: {(): horoscope_memory.stats()["size"]})
+outbox_backlog: Dict[str, int] = {}  # последний снимок очереди уведомлений, обновляется при запросе /metrics
+registry.gauge("notification_outbox_entries", "Записи очереди уведомлений по статусу",
+               lambda: {(status,): count for status, count in outbox_backlog.items()}, ("status",))
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в текстовом формате Prometheus"""
+    backlog = await asyncio.get_running_loop().run_in_executor(None, notification_outbox.backlog)
+    outbox_backlog.clear()
+    outbox_backlog.update(backlog)
+    return Response(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+if PROFILING_ENABLED:
+    @app.get("/admin/profiles")
+    async def list_profiles(x_profile_secret: Optional[str] = Header(None)):
+        """Последние профили запросов (без содержимого)"""
+        if not secret_matches(x_profile_secret):
+            raise HTTPException(status_code=403, detail="Неверный секрет профилирования")
+        return {"profiles": profile_store.list(), **profile_store.stats()}
+
+    @app.get("/admin/profiles/{profile_id}")
+    async def get_profile(profile_id: int, format: str = "text", sort: str = "cumulative",
+                          limit: int = Query(60, ge=1, le=1000), x_profile_secret: Optional[str] = Header(None)):
+        """Профиль запроса: текстовый отчёт pstats или файл .prof (format=pstats)"""
+        if not secret_matches(x_profile_secret):
+            raise HTTPException(status_code=403, detail="Неверный секрет профилирования")
+        entry = profile_store.get(profile_id)
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Профиль не найден (буфер хранит только последние)")
+        _, meta, dump = entry
+        if format == "pstats":
+            # Формат cProfile.Profile.dump_stats: открывается pstats.Stats и snakeviz
+            return Response(dump, media_type="application/octet-stream",
+                            headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.prof"'})
+        if format != "text":
+            raise HTTPException(status_code=400, detail="format: text или pstats")
+        try:
+            report = profile_store.report(dump, sort, limit)
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Неизвестный ключ сортировки: {sort}")
+        header = " ".join(f"{key}={value}" for key, value in meta.items())
+        return Response(f"{header}\n\n{report}", media_type="text/plain; charset=utf-8")
+
 @app.get("/api/horoscope")
 async def get_horoscope(sign: str, date: Optional[str] = None, user_id: Optional[int] = None):
     """Получить гороскоп для знака зодиака с актуальными данными"""
+    return await horoscope_payload(sign, date, user_id)
+
+async def horoscope_payload(sign: str, date: Optional[str] = None, user_id: Optional[int] = None) -> Dict:
+    """Гороскоп знака на дату в формате ответа /api/horoscope"""
     if date is None:
         date = today_key()
     
@@ -320,37 +433,90 @@ async def get_horoscope(sign: str, date: Optional[str] = None, user_id: Optional
     if user_id:
         log_user_action(user_id, "get_horoscope", {"sign": sign, "date": date})
     
-    conn = get_db()
-    cur = conn.cursor()
+    horoscope_text, source = await get_cached_horoscope(sign, date)
+    horoscope_lookups.inc(source, "true" if source in ("memory", "cache") else "false")
     
-    cur.execute("SELECT text FROM daily_cache WHERE sign=? AND date=?", (sign, date))
-    row = cur.fetchone()
+    return {
+        "sign": sign,
+        "date": date,
+        "text": horoscope_text,
+        "cached": source in ("memory", "cache"),
+        "source": source
+    }
+
+@app.get("/api/horoscope/matrix")
+async def get_horoscope_matrix(signs: Optional[str] = None, date_from: Optional[str] = Query(None, alias="from"),
+                               date_to: Optional[str] = Query(None, alias="to"), user_id: Optional[int] = None):
+    """Гороскопы для набора знаков на диапазон дат одним запросом"""
+    sign_list = list(dict.fromkeys(s.strip() for s in signs.split(",") if s.strip())) if signs else list(ZODIAC_MAP)
+    unknown = [sign for sign in sign_list if sign not in ZODIAC_MAP]
+    if unknown or not sign_list:
+        raise HTTPException(status_code=400, detail=f"Неизвестный знак зодиака: {', '.join(unknown)}")
     
-    if row:
-        conn.close()
-        return {
-            "sign": sign,
-            "date": date,
-            "text": row[0],
-            "cached": True,
-            "source": "cache"
-        }
+    try:
+        start = datetime.strptime(date_from or today_key(), "%Y-%m-%d").date()
+        end = datetime.strptime(date_to or date_from or today_key(), "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Даты должны быть в формате YYYY-MM-DD")
+    if end < start:
+        raise HTTPException(status_code=400, detail="Дата 'to' раньше даты 'from'")
     
-    horoscope_text = await get_real_horoscope_data(sign, date)
+    days = (end - start).days + 1
+    if len(sign_list) * days > MATRIX_MAX_CELLS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Слишком большая матрица: {len(sign_list)} x {days}, максимум {MATRIX_MAX_CELLS} ячеек"
+        )
+    dates = [(start + timedelta(days=offset)).isoformat() for offset in range(days)]
     
-    cur.execute(
-        "INSERT OR REPLACE INTO daily_cache(sign, date, text, created_at) VALUES(?,?,?,?)",
-        (sign, date, horoscope_text, datetime.now(timezone.utc).isoformat())
-    )
-    conn.commit()
-    conn.close()
+    if user_id:
+        log_user_action(user_id, "get_horoscope_matrix", {"signs": len(sign_list), "from": dates[0], "to": dates[-1]})
+    
+    cells: Dict[str, Dict[str, str]] = {sign: {} for sign in sign_list}
+    missing = []
+    for sign in sign_list:
+        for date in dates:
+            text = horoscope_memory.get((sign, date))
+            if text is None:
+                missing.append((sign, date))
+            else:
+                cells[sign][date] = text
+    # real_api - ячейки, ради которых этот запрос сходил во внешний API
+    sources = {"memory": len(sign_list) * days - len(missing), "cache": 0, "real_api": 0, "template": 0}
+    
+    if missing and horoscope_provider.enabled:
+        # Все сохранённые ячейки - одним запросом по индексу (sign, date)
+        rows = await database.read(dal.get_daily_range, sign_list, dates[0], dates[-1])
+        for sign, date, text in rows:
+            if date not in cells[sign]:
+                cells[sign][date] = text
+                horoscope_memory.set((sign, date), text)
+                sources["cache"] += 1
+        missing = [(sign, date) for sign, date in missing if date not in cells[sign]]
+    
+    if missing:
+        # API отдаёт только вчера/сегодня/завтра: не больше трёх запросов на знак, и те через
+        # single-flight /api/horoscope; каждый ответ API пишется отдельно внутри fill_daily_cache
+        # (не больше 36 записей на запрос). Остальные даты - шаблоны, они не сохраняются
+        servable = [(sign, date) for sign, date in missing
+                    if horoscope_provider.enabled and provider_day(date) is not None]
+        fetched = await asyncio.gather(*(
+            horoscope_flight.do((sign, date), lambda sign=sign, date=date: fill_daily_cache(sign, date))
+            for sign, date in servable
+        ))
+        for (sign, date), (text, source) in zip(servable, fetched):
+            cells[sign][date] = text
+            sources[source] += 1
+        for sign, date in missing:
+            if date not in cells[sign]:
+                cells[sign][date] = template_horoscope(sign, date)
+                sources["template"] += 1
     
     return {
-        "sign": sign,
-        "date": date,
-        "text": horoscope_text,
-        "cached": False,
-        "source": "real_api" if API_KEY_HOROSCOPE else "template"
+        "signs": sign_list,
+        "dates": dates,
+        "cells": cells,
+        "sources": sources
     }
 
 @app.post("/api/day-card")
@@ -365,44 +531,56 @@ async def get_day_card(request: Request):
         
         user = verify_telegram_data(init_data)
         user_id = user["id"] if user else 12345
-        date = today_key()
-        
-        conn = get_db()
-        cur = conn.cursor()
-        
-        cur.execute("SELECT card_title, card_text FROM day_cards WHERE user_id=? AND date=?", (user_id, date))
-        row = cur.fetchone()
-        
-        if row:
-            conn.close()
-            return {
-                "title": row[0],
-                "text": row[1],
-                "reused": True,
-                "date": date
-            }
-        
-        card = random.choice(DAY_CARDS)
         
-        cur.execute(
-            "INSERT INTO day_cards(user_id, date, card_title, card_text, created_at) VALUES(?,?,?,?,?)",
-            (user_id, date, card["название"], card["совет"], datetime.now(timezone.utc).isoformat())
-        )
-        conn.commit()
-        conn.close()
-        
-        log_user_action(user_id, "get_day_card", {"card": card["название"]})
-        
-        return {
-            "title": card["название"],
-            "text": card["совет"],
-            "reused": False,
-            "date": date
-        }
+        card = await database.read(draw_day_card, user_id, today_key())
+        note_day_card(user_id, card)
+        return card
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Ошибка получения карты дня: {str(e)}")
 
+DAY_CARD_KEY = (DAY_CARD_SECRET or hashlib.sha256(f"day-card:{BOT_TOKEN}".encode()).hexdigest()).encode()
+
+def derive_day_card(user_id: int, date: str) -> Dict:
+    """Карта дня, однозначно определяемая (пользователь, дата); ключ не даёт угадать карты других"""
+    digest = hmac.new(DAY_CARD_KEY, f"{user_id}:{date}".encode(), hashlib.sha256).digest()
+    return DAY_CARDS[int.from_bytes(digest[:8], "big") % len(DAY_CARDS)]
+
+def draw_day_card(conn, user_id: int, date: str) -> Dict:
+    """Карта дня пользователя без записи в БД
+    
+    Карта вычисляется из (user_id, дата); строки day_cards, сохранённые до перехода
+    на вычисляемые карты, по-прежнему имеют приоритет. Агрегат user_action_daily
+    отмечает показы из других процессов и до перезапуска; показы в этом процессе
+    учитывает note_day_card, так как аналитика пишется с задержкой.
+    """
+    row, shown = dal.get_day_card_state(conn, user_id, date)
+    
+    if row:
+        title, text = row
+    else:
+        card = derive_day_card(user_id, date)
+        title, text = card["название"], card["совет"]
+    
+    return {
+        "title": title,
+        "text": text,
+        "reused": bool(row) or bool(shown),
+        "date": date
+    }
+
+def note_day_card(user_id: int, card: Dict):
+    """Отметить показ карты: повторный показ в этом процессе - reused, в аналитику попадает только первый"""
+    key = (user_id, card["date"])
+    if day_cards_shown.get(key):
+        card["reused"] = True
+        return
+    day_cards_shown.set(key, True)
+    if not card["reused"]:
+        log_user_action(user_id, "get_day_card", {"card": card["title"]})
+
 @app.post("/api/favorites")
 async def add_favorite(request: Request):
     """Добавить в избранное"""
@@ -418,26 +596,33 @@ async def add_favorite(request: Request):
         user = verify_telegram_data(init_data)
         user_id = user["id"] if user else 12345
         
-        conn = get_db()
-        cur = conn.cursor()
-        
-        cur.execute(
-            "INSERT INTO favorites(user_id, content_type, content, added_at) VALUES(?,?,?,?)",
-            (user_id, content_type, json.dumps(content, ensure_ascii=False), datetime.now(timezone.utc).isoformat())
-        )
-        conn.commit()
-        conn.close()
+        await database.write(dal.add_favorite, user_id, content_type, content, datetime.now(timezone.utc).isoformat())
         
         log_user_action(user_id, "add_favorite", {"type": content_type})
         
         return {"status": "added", "message": "Добавлено в избранное"}
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Ошибка добавления в избранное: {str(e)}")
 
+def encode_favorites_cursor(added_at: str, favorite_id: int) -> str:
+    """Курсор страницы избранного: позиция последней отданной записи"""
+    return base64.urlsafe_b64encode(f"{added_at}|{favorite_id}".encode()).decode().rstrip("=")
+
+def decode_favorites_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        added_at, favorite_id = raw.rsplit("|", 1)
+        return added_at, int(favorite_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
 @app.get("/api/favorites")
-async def get_favorites(init_data: str):
-    """Получить избранное пользователя"""
+async def get_favorites(init_data: str, limit: int = FAVORITES_PAGE_SIZE, before: Optional[str] = None,
+                        summary: bool = False):
+    """Получить избранное пользователя постранично (от новых к старым) или сводку по типам"""
     try:
         if not init_data:
             raise HTTPException(status_code=400, detail="initData отсутствует")
@@ -445,26 +630,42 @@ async def get_favorites(init_data: str):
         user = verify_telegram_data(init_data)
         user_id = user["id"] if user else 12345
         
-        conn = get_db()
-        cur = conn.cursor()
+        if summary:
+            # Сводка для бейджей: считается по индексу, без чтения содержимого
+            types = await database.read(dal.favorites_summary, user_id)
+            return {"count": sum(types.values()), "types": types}
         
-        cur.execute("SELECT content_type, content, added_at FROM favorites WHERE user_id=? ORDER BY added_at DESC", (user_id,))
-        rows = cur.fetchall()
-        conn.close()
-        
-        favorites = []
-        for row in rows:
-            favorites.append({
-                "type": row[0],
-                "content": json.loads(row[1]),
-                "added_at": row[2]
-            })
-        
-        return {"favorites": favorites}
+        body = await database.read(favorites_page_json, user_id, limit, before)
+        return Response(content=body.encode("utf-8"), media_type="application/json")
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Ошибка получения избранного: {str(e)}")
 
+def compact_json(value: Any) -> str:
+    """JSON для ответов, собираемых из готовых фрагментов: тот же формат, что у content_blobs"""
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def favorites_page_json(conn, user_id: int, limit: int = FAVORITES_PAGE_SIZE, before: Optional[str] = None) -> str:
+    """Страница избранного (от новых к старым) готовым JSON: {"favorites": [...], "next_cursor": ...}"""
+    limit = max(1, min(limit, FAVORITES_MAX_PAGE_SIZE))
+    position = decode_favorites_cursor(before) if before else None
+    # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+    rows = dal.favorites_page(conn, user_id, limit + 1, position)
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_favorites_cursor(rows[-1][3], rows[-1][0])
+    
+    # content хранится сериализованным JSON и вставляется в ответ как есть, без json.loads/dumps
+    items = ",".join(
+        f'{{"type":{compact_json(row[1])},"content":{row[2]},"added_at":{compact_json(row[3])}}}'
+        for row in rows
+    )
+    return f'{{"favorites":[{items}],"next_cursor":{compact_json(next_cursor)}}}'
+
 # Новые эндпоинты для расширенного функционала
 
 @app.post("/api/user/settings")
@@ -481,36 +682,25 @@ async def save_user_settings(request: Request):
         user = verify_telegram_data(init_data)
         user_id = user["id"] if user else 12345
         
-        conn = get_db()
-        cur = conn.cursor()
-        
         log_user_action(user_id, "save_settings", settings)
         
-        now = datetime.now(timezone.utc).isoformat()
-        cur.execute("""
-            INSERT OR REPLACE INTO user_settings 
-            (user_id, zodiac_sign, birth_time, birth_location, notification_time, 
-             premium, language, theme, created_at, updated_at) 
-            VALUES (?,?,?,?,?,?,?,?,?,?)
-        """, (
+        await database.write(dal.save_user_settings, user_id, settings, datetime.now(timezone.utc).isoformat())
+        
+        # Данные рождения могли измениться - премиум-набор пересчитается при следующем запросе
+        premium_cache.pop(user_id)
+        # Остальные воркеры увидят изменение при сверке наступившего слота с user_settings
+        notification_scheduler.schedule(
             user_id,
             settings.get("zodiac_sign"),
-            settings.get("birth_time"),
-            settings.get("birth_location"),
             settings.get("notification_time", "09:00"),
-            settings.get("premium", False),
-            settings.get("language", "ru"),
-            settings.get("theme", "light"),
-            now,
-            now
-        ))
-        
-        conn.commit()
-        conn.close()
+            settings.get("timezone", "UTC")
+        )
         
         return {"status": "success", "message": "Настройки сохранены"}
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Ошибка сохранения настроек: {str(e)}")
 
 @app.get("/api/user/settings")
@@ -520,79 +710,143 @@ async def get_user_settings(init_data: str):
         user = verify_telegram_data(init_data)
         user_id = user["id"] if user else 12345
         
-        conn = get_db()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT zodiac_sign, birth_time, birth_location, notification_time, 
-                   premium, language, theme, created_at 
-            FROM user_settings WHERE user_id=?
-        """, (user_id,))
-        
-        row = cur.fetchone()
-        conn.close()
-        
-        if row:
-            return {
-                "zodiac_sign": row[0],
-                "birth_time": row[1],
-                "birth_location": row[2],
-                "notification_time": row[3],
-                "premium": bool(row[4]),
-                "language": row[5],
-                "theme": row[6],
-                "created_at": row[7]
-            }
-        else:
-            return {
-                "zodiac_sign": None,
-                "birth_time": None,
-                "birth_location": None,
-                "notification_time": "09:00",
-                "premium": False,
-                "language": "ru",
-                "theme": "light",
-                "created_at": None
-            }
+        return await database.read(read_user_settings, user_id)
             
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Ошибка получения настроек: {str(e)}")
 
-@app.get("/api/analytics/user")
-async def get_user_analytics(init_data: str):
-    """Получить аналитику пользователя (Аналитика)"""
+def read_user_settings(conn, user_id: int) -> Dict:
+    """Настройки пользователя или значения по умолчанию"""
+    row = dal.get_user_settings(conn, user_id)
+    
+    if row:
+        return {
+            "zodiac_sign": row[0],
+            "birth_time": row[1],
+            "birth_location": row[2],
+            "notification_time": row[3],
+            "premium": bool(row[4]),
+            "language": row[5],
+            "theme": row[6],
+            "created_at": row[7],
+            "timezone": row[8]
+        }
+    return {
+        "zodiac_sign": None,
+        "birth_time": None,
+        "birth_location": None,
+        "notification_time": "09:00",
+        "premium": False,
+        "language": "ru",
+        "theme": "light",
+        "created_at": None,
+        "timezone": "UTC"
+    }
+
+BOOTSTRAP_PARTS = ("settings", "horoscope", "day_card", "favorites")
+
+@app.post("/api/bootstrap")
+async def bootstrap(request: Request):
+    """Стартовые данные Mini App одним запросом: настройки, гороскоп, карта дня и избранное
+    
+    initData проверяется один раз, запросы к БД идут одной операцией чтения на одном соединении,
+    а гороскоп (возможный поход во внешний API) выполняется параллельно с ними. Ошибка одной части
+    не ломает ответ: часть возвращается как null, а причина - в "errors".
+    """
     try:
+        payload = await request.json()
+        init_data = payload.get("initData")
+        
+        if not init_data:
+            raise HTTPException(status_code=400, detail="initData отсутствует")
+        
+        requested = payload.get("parts") or BOOTSTRAP_PARTS
+        if not isinstance(requested, (list, tuple)) or not all(
+            isinstance(part, str) and part in BOOTSTRAP_PARTS for part in requested
+        ):
+            raise HTTPException(
+                status_code=400, detail=f"parts должен быть списком из: {', '.join(BOOTSTRAP_PARTS)}"
+            )
+        parts = [part for part in BOOTSTRAP_PARTS if part in requested]
+        sign = payload.get("sign")
+        
         user = verify_telegram_data(init_data)
         user_id = user["id"] if user else 12345
+        date = today_key()
+        
+        results: Dict[str, str] = {}  # часть -> готовый JSON
+        errors: Dict[str, str] = {}
         
-        conn = get_db()
-        cur = conn.cursor()
+        def fail(part: str, e: Exception):
+            errors[part] = e.detail if isinstance(e, HTTPException) else str(e)
         
-        cur.execute("""
-            SELECT action, COUNT(*) as count 
-            FROM user_analytics 
-            WHERE user_id=? 
-            GROUP BY action 
-            ORDER BY count DESC
-        """, (user_id,))
+        async def load_horoscope(horoscope_sign: Optional[str]):
+            try:
+                if not horoscope_sign:
+                    raise HTTPException(status_code=400, detail="Знак зодиака не указан")
+                results["horoscope"] = compact_json(await horoscope_payload(horoscope_sign, date, user_id))
+            except Exception as e:
+                fail("horoscope", e)
         
-        action_stats = {row[0]: row[1] for row in cur.fetchall()}
+        def read_parts(conn) -> Tuple[Optional[Dict], Optional[Dict]]:
+            settings = card = None
+            if "settings" in parts or ("horoscope" in parts and not sign):
+                try:
+                    settings = read_user_settings(conn, user_id)
+                    if "settings" in parts:
+                        results["settings"] = compact_json(settings)
+                except Exception as e:
+                    fail("settings", e)
+            if "day_card" in parts:
+                try:
+                    card = draw_day_card(conn, user_id, date)
+                except Exception as e:
+                    fail("day_card", e)
+            if "favorites" in parts:
+                try:
+                    results["favorites"] = favorites_page_json(
+                        conn, user_id, int(payload.get("favorites_limit") or FAVORITES_PAGE_SIZE)
+                    )
+                except Exception as e:
+                    fail("favorites", e)
+            return settings, card
+        
+        async def load_from_db() -> Optional[Dict]:
+            settings, card = await database.read(read_parts)
+            if card:
+                note_day_card(user_id, card)
+                results["day_card"] = compact_json(card)
+            return settings
+        
+        if "horoscope" in parts and sign:
+            await asyncio.gather(load_horoscope(sign), load_from_db())
+        else:
+            settings = await load_from_db()
+            if "horoscope" in parts:
+                # Знак не передан: берём его из настроек
+                await load_horoscope(settings["zodiac_sign"] if settings else None)
         
-        cur.execute("""
-            SELECT action, data, timestamp 
-            FROM user_analytics 
-            WHERE user_id=? 
-            ORDER BY timestamp DESC 
-            LIMIT 10
-        """, (user_id,))
+        fields = [f'"user_id":{user_id}']
+        fields += [f'"{part}":{results.get(part, "null")}' for part in parts]
+        fields.append(f'"errors":{compact_json(errors)}')
+        body = "{" + ",".join(fields) + "}"
+        return Response(content=body.encode("utf-8"), media_type="application/json")
         
-        recent_actions = [{
-            "action": row[0],
-            "data": json.loads(row[1]) if row[1] else None,
-            "timestamp": row[2]
-        } for row in cur.fetchall()]
+    except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail=f"Ошибка загрузки стартовых данных: {str(e)}")
+
+@app.get("/api/analytics/user")
+async def get_user_analytics(init_data: str):
+    """Получить аналитику пользователя (Аналитика)"""
+    try:
+        user = verify_telegram_data(init_data)
+        user_id = user["id"] if user else 12345
         
-        conn.close()
+        action_stats, recent_actions = await database.read(dal.get_user_analytics, user_id, RECENT_ACTIONS_LIMIT)
         
         return {
             "user_id": user_id,
@@ -602,6 +856,8 @@ async def get_user_analytics(init_data: str):
         }
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Ошибка получения аналитики: {str(e)}")
 
 @app.post("/api/horoscope/premium")
@@ -614,28 +870,34 @@ async def get_premium_horoscope(request: Request):
         
         user = verify_telegram_data(init_data)
         user_id = user["id"] if user else 12345
-        
-        conn = get_db()
-        cur = conn.cursor()
-        cur.execute("SELECT premium, birth_time, birth_location FROM user_settings WHERE user_id=?", (user_id,))
-        user_data = cur.fetchone()
-        conn.close()
+        date = today_key()
         
         log_user_action(user_id, "get_premium_horoscope", {"sign": sign})
         
-        birth_time = user_data[1] if user_data else None
-        birth_location = user_data[2] if user_data else None
-        premium_data = generate_premium_horoscope(sign, birth_time, birth_location)
+        # Набор считается один раз на (пользователь, дата, знак, данные рождения) и истекает
+        # в полночь UTC. Данные рождения читаются по первичному ключу на каждый запрос:
+        # настройки могли сохраниться в другом воркере, где сброс кеша этого не видит
+        birth_time, birth_location = await database.read(dal.get_birth_data, user_id)
+        fingerprint = (date, sign, birth_time, birth_location)
+        cached = premium_cache.get(user_id)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
         
-        return {
+        premium_data = generate_premium_horoscope(sign, birth_time, birth_location, user_id, date)
+        
+        response = {
             "sign": sign,
-            "date": today_key(),
+            "date": date,
             "premium_data": premium_data,
             "user_birth_time": birth_time,
             "user_location": birth_location
         }
+        premium_cache.set(user_id, (fingerprint, response))
+        return response
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Ошибка получения премиум гороскопа: {str(e)}")
 
 @app.post("/api/share")
@@ -651,26 +913,11 @@ async def share_content(request: Request):
         user = verify_telegram_data(init_data)
         user_id = user["id"] if user else 12345
         
-        conn = get_db()
-        cur = conn.cursor()
-        
         log_user_action(user_id, "share_content", {"type": content_type})
         
-        cur.execute("""
-            INSERT INTO shared_content 
-            (user_id, content_type, content, share_text, created_at) 
-            VALUES (?,?,?,?,?)
-        """, (
-            user_id,
-            content_type,
-            json.dumps(content, ensure_ascii=False),
-            share_text,
-            datetime.now(timezone.utc).isoformat()
-        ))
-        
-        share_id = cur.lastrowid
-        conn.commit()
-        conn.close()
+        share_id = await database.write(
+            dal.add_shared_content, user_id, content_type, content, share_text, datetime.now(timezone.utc).isoformat()
+        )
         
         share_url = f"{FRONTEND_URL}/shared/{share_id}"
         
@@ -682,36 +929,21 @@ async def share_content(request: Request):
         }
         
     except Exception as e:
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail=f"Ошибка создания репоста: {str(e)}")
 
 @app.get("/api/shared/{share_id}")
 async def get_shared_content(share_id: int):
     """Получить опубликованный контент"""
     try:
-        conn = get_db()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT content_type, content, share_text, share_count, created_at 
-            FROM shared_content WHERE id=?
-        """, (share_id,))
+        # Контент отдаётся из кеша, просмотры записываются в БД пакетами
+        shared = await share_views.view(share_id)
         
-        row = cur.fetchone()
-        
-        if not row:
+        if not shared:
             raise HTTPException(status_code=404, detail="Контент не найден")
         
-        cur.execute("UPDATE shared_content SET share_count = share_count + 1 WHERE id=?", (share_id,))
-        conn.commit()
-        conn.close()
-        
-        return {
-            "content_type": row[0],
-            "content": json.loads(row[1]),
-            "share_text": row[2],
-            "views": row[3] + 1,
-            "created_at": row[4]
-        }
+        return shared
         
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -719,43 +951,18 @@ async def get_shared_content(share_id: int):
         raise HTTPException(status_code=500, detail=f"Ошибка получения контента: {str(e)}")
 
 # Функция для отправки push-уведомлений
-async def send_daily_horoscopes():
-    """Отправка ежедневных гороскопов через Telegram Bot (Push-уведомления)"""
-    try:
-        conn = get_db()
-        cur = conn.cursor()
-        
-        cur.execute("""
-            SELECT user_id, zodiac_sign, notification_time 
-            FROM user_settings 
-            WHERE zodiac_sign IS NOT NULL
-        """)
-        
-        users = cur.fetchall()
-        conn.close()
-        
-        current_time = datetime.now().strftime("%H:%M")
-        
-        for user_id, zodiac_sign, notification_time in users:
-            if notification_time == current_time:
-                horoscope_text = await get_real_horoscope_data(zodiac_sign)
-                
-                telegram_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-                message_data = {
-                    "chat_id": user_id,
-                    "text": f"🧙‍♂️ Ваш гороскоп на сегодня ({zodiac_sign}):\n\n{horoscope_text}",
-                    "parse_mode": "HTML"
-                }
-                
-                try:
-                    response = requests.post(telegram_url, json=message_data, timeout=10)
-                    if response.status_code == 200:
-                        log_user_action(user_id, "daily_notification_sent", {"sign": zodiac_sign})
-                except Exception as e:
-                    print(f"Ошибка отправки уведомления {user_id}: {e}")
-                    
-    except Exception as e:
-        print(f"Ошибка отправки ежедневных гороскопов: {e}")
+async def render_daily_message(zodiac_sign: str, date: str) -> str:
+    """Текст push-уведомления с гороскопом (один раз на знак и дату)"""
+    horoscope_text, _ = await get_cached_horoscope(zodiac_sign, date)
+    return f"🧙‍♂️ Ваш гороскоп на сегодня ({zodiac_sign}):\n\n{horoscope_text}"
+
+def on_notification_sent(user_id: int, zodiac_sign: str):
+    log_user_action(user_id, "daily_notification_sent", {"sign": zodiac_sign})
+
+notification_outbox = NotificationOutbox(db_pool, telegram_sender, render_daily_message, on_notification_sent)
+
+# Уведомления ставятся в очередь в момент notification_time по часовому поясу пользователя
+notification_scheduler = NotificationScheduler(db_pool, notification_outbox)
 
 # Для деплоя на Render и локального запуска
 if __name__ == "__main__":
@@ -767,19 +974,11 @@ if __name__ == "__main__":
     
     print("🚀 Запуск Gnome Horoscope API v2.0...")
     print(f"📡 CORS для: {FRONTEND_URL}")
-    print(f"💾 База данных: database.db (в текущей папке)")
+    print(f"💾 База данных: {DATABASE_PATH}")
     print("✨ Новые функции: Персонализация, Push-уведомления, Соцсети, Премиум, Аналитика")
     print("🔮 Актуальные данные гороскопов через внешние API")
     print(f"🌐 Запуск на {host}:{port}")
-    
-    # Инициализируем БД при старте
-    print("📊 Инициализация базы данных...")
-    try:
-        conn = get_db()
-        conn.close()
-        print("✅ База данных готова")
-    except Exception as e:
-        print(f"❌ Ошибка инициализации БД: {e}")
+    # База данных инициализируется в lifespan при старте приложения
     
     # Запускаем сервер
     uvicorn.run(
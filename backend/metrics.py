@@ -0,0 +1,207 @@
+import time
+import bisect
+import contextvars
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for values, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labels, values)} {value}"
+
+
+class Histogram:
+    """Гистограмма: счётчики по корзинам, сумма и количество наблюдений"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List] = {}  # метки -> [счётчики корзин..., сумма, количество]
+
+    def observe(self, value: float, *label_values: str):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        # Наблюдение попадает в одну корзину; накопительные значения считаются при выводе
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for values, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labels, values, le)} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labels, values)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labels, values)} {series[-1]}"
+
+
+class Gauge:
+    """Мгновенное значение, снимаемое функцией в момент запроса /metrics"""
+
+    def __init__(self, name: str, help_text: str, collect: Callable[[], Dict[Labels, float]],
+                 labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.collect = collect
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        try:
+            samples = self.collect()
+        except Exception as e:
+            print(f"Ошибка сбора метрики {self.name}: {e}")
+            return
+        for values, value in samples.items():
+            yield f"{self.name}{_format_labels(self.labels, values)} {value}"
+
+
+class Registry:
+    """Набор метрик приложения
+
+    Счётчики и гистограммы обновляются только из потока event loop (время запросов к БД
+    измеряется в рабочих потоках, но записывается после await), поэтому блокировки не нужны:
+    обновление - это поиск в словаре и сложение.
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, collect: Callable[[], Dict[Labels, float]],
+              labels: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, collect, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "http_requests_total", "HTTP запросы по маршруту и статусу", ("method", "route", "status"))
+http_duration = registry.histogram(
+    "http_request_duration_seconds", "Время обработки HTTP запроса", ("method", "route"))
+http_db_time = registry.histogram(
+    "http_request_db_seconds", "Суммарное время запросов к SQLite за HTTP запрос", ("method", "route"), DB_BUCKETS)
+http_db_queries = registry.histogram(
+    "http_request_db_queries", "Число операций с SQLite за HTTP запрос", ("method", "route"), COUNT_BUCKETS)
+db_operations = registry.histogram(
+    "db_operation_duration_seconds", "Время операции с SQLite в рабочем потоке", ("kind",), DB_BUCKETS)
+horoscope_lookups = registry.counter(
+    "horoscope_lookups_total", "Запросы гороскопа по источнику ответа и попаданию в кеш", ("source", "cached"))
+provider_duration = registry.histogram(
+    "provider_request_duration_seconds", "Время запроса к внешнему провайдеру гороскопов", ("provider",))
+provider_requests = registry.counter(
+    "provider_requests_total", "Запросы к внешнему провайдеру по результату", ("provider", "outcome"))
+
+# Время и число операций с БД в рамках текущего HTTP запроса: [секунды, операции]
+request_db_usage: contextvars.ContextVar[Optional[List]] = contextvars.ContextVar("request_db_usage", default=None)
+
+
+def record_db_operation(kind: str, seconds: float):
+    """Учесть операцию с БД (вызывается в потоке event loop)"""
+    db_operations.observe(seconds, kind)
+    usage = request_db_usage.get()
+    if usage is not None:
+        usage[0] += seconds
+        usage[1] += 1
+
+
+class MetricsMiddleware:
+    """ASGI middleware: число запросов, задержка и время в БД по шаблону маршрута"""
+
+    def __init__(self, app, routes: Sequence = ()):
+        self.app = app
+        self.routes = routes
+        self._paths: Dict = {}
+
+    def _route_label(self, scope) -> str:
+        # Starlette 0.27 не кладёт в scope маршрут, только endpoint: шаблон пути ищем по нему
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._paths.get(endpoint)
+        if path is None:
+            self._paths = {getattr(route, "endpoint", None): route.path for route in self.routes}
+            path = self._paths.get(endpoint, "unmatched")
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        usage = [0.0, 0]
+        token = request_db_usage.set(usage)
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_db_usage.reset(token)
+            method = scope["method"]
+            route = self._route_label(scope)
+            http_requests.inc(method, route, str(status))
+            http_duration.observe(time.perf_counter() - started, method, route)
+            http_db_time.observe(usage[0], method, route)
+            http_db_queries.observe(usage[1], method, route)
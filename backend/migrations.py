@@ -0,0 +1,301 @@
+import json
+import sqlite3
+from datetime import datetime, timezone
+
+from blobs import canonical_content, store_body
+
+CONTENT_REF_TABLES = ("favorites", "shared_content")
+
+
+def _move_content_to_blobs(conn: sqlite3.Connection):
+    """Перенести содержимое favorites и shared_content в content_blobs, сохранив id строк"""
+    for table in CONTENT_REF_TABLES:
+        rows = conn.execute(f"SELECT id, content FROM {table}").fetchall()
+        refs = []
+        for row_id, content in rows:
+            try:
+                body = canonical_content(json.loads(content))
+            except ValueError:
+                body = canonical_content(content)  # не JSON: сохраняем как строку
+            refs.append((store_body(conn, body), row_id))
+        conn.executemany(f"UPDATE {table}_new SET content_id=? WHERE id=?", refs)
+    conn.execute("""
+        UPDATE content_blobs SET refcount =
+            (SELECT COUNT(*) FROM favorites_new WHERE content_id = content_blobs.id) +
+            (SELECT COUNT(*) FROM shared_content_new WHERE content_id = content_blobs.id)
+    """)
+
+
+def _content_ref_triggers(table: str):
+    """Триггеры, поддерживающие refcount блобов при изменении ссылающихся строк"""
+    return [
+        f"""
+        CREATE TRIGGER {table}_blob_ref_insert AFTER INSERT ON {table} BEGIN
+            UPDATE content_blobs SET refcount = refcount + 1 WHERE id = NEW.content_id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER {table}_blob_ref_delete AFTER DELETE ON {table} BEGIN
+            UPDATE content_blobs SET refcount = refcount - 1 WHERE id = OLD.content_id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER {table}_blob_ref_update AFTER UPDATE OF content_id ON {table} BEGIN
+            UPDATE content_blobs SET refcount = refcount - 1 WHERE id = OLD.content_id;
+            UPDATE content_blobs SET refcount = refcount + 1 WHERE id = NEW.content_id;
+        END
+        """,
+    ]
+
+
+# Упорядоченные шаги миграций: (версия, название, список SQL или функций от соединения)
+# Новые шаги добавляются только в конец списка, существующие не изменяются
+MIGRATIONS = [
+    (1, "initial_schema", [
+        """
+        CREATE TABLE IF NOT EXISTS daily_cache (
+            id INTEGER PRIMARY KEY,
+            sign TEXT NOT NULL,
+            date TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            UNIQUE(sign, date)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS day_cards (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            card_title TEXT NOT NULL,
+            card_text TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            UNIQUE(user_id, date)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS favorites (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            added_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_settings (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER UNIQUE NOT NULL,
+            zodiac_sign TEXT,
+            birth_time TEXT,
+            birth_location TEXT,
+            notification_time TEXT DEFAULT '09:00',
+            premium INTEGER DEFAULT 0,
+            language TEXT DEFAULT 'ru',
+            theme TEXT DEFAULT 'light',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_analytics (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            data TEXT,
+            timestamp TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS shared_content (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            content TEXT NOT NULL,
+            share_text TEXT NOT NULL,
+            share_count INTEGER DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+        """,
+    ]),
+    (2, "per_user_indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_favorites_user_added ON favorites(user_id, added_at)",
+        "CREATE INDEX IF NOT EXISTS idx_analytics_user_action ON user_analytics(user_id, action)",
+        "CREATE INDEX IF NOT EXISTS idx_analytics_user_timestamp ON user_analytics(user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_shared_user_created ON shared_content(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_settings_notification_time ON user_settings(notification_time)",
+    ]),
+    (3, "prewarm_runs", [
+        """
+        CREATE TABLE IF NOT EXISTS prewarm_runs (
+            id INTEGER PRIMARY KEY,
+            date TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            duration_ms INTEGER NOT NULL,
+            warmed INTEGER NOT NULL,
+            failed INTEGER NOT NULL,
+            status TEXT NOT NULL
+        )
+        """,
+    ]),
+    (4, "notification_outbox", [
+        """
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            notify_date TEXT NOT NULL,
+            zodiac_sign TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            available_at TEXT NOT NULL,
+            claimed_at TEXT,
+            sent_at TEXT,
+            created_at TEXT NOT NULL,
+            UNIQUE(user_id, notify_date)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_outbox_status_available ON notification_outbox(status, available_at)",
+    ]),
+    (5, "user_settings_timezone", [
+        "ALTER TABLE user_settings ADD COLUMN timezone TEXT DEFAULT 'UTC'",
+    ]),
+    (6, "analytics_rollups", [
+        """
+        CREATE TABLE IF NOT EXISTS user_action_counts (
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY(user_id, action)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_action_daily (
+            user_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            action TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY(user_id, day, action)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_recent_actions (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,
+            data TEXT,
+            timestamp TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_recent_actions_user ON user_recent_actions(user_id, id)",
+        # Перенос уже накопленной истории в агрегаты
+        """
+        INSERT INTO user_action_counts(user_id, action, count)
+        SELECT user_id, action, COUNT(*) FROM user_analytics GROUP BY user_id, action
+        """,
+        """
+        INSERT INTO user_action_daily(user_id, day, action, count)
+        SELECT user_id, substr(timestamp, 1, 10), action, COUNT(*)
+        FROM user_analytics GROUP BY user_id, substr(timestamp, 1, 10), action
+        """,
+        """
+        INSERT INTO user_recent_actions(user_id, action, data, timestamp)
+        SELECT user_id, action, data, timestamp FROM (
+            SELECT user_id, action, data, timestamp, id,
+                   ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY timestamp DESC, id DESC) AS rn
+            FROM user_analytics
+        ) WHERE rn <= 10 ORDER BY timestamp, id
+        """,
+    ]),
+    (7, "favorites_type_index", [
+        # Сводка избранного по типам считается по покрывающему индексу
+        "CREATE INDEX IF NOT EXISTS idx_favorites_user_type ON favorites(user_id, content_type)",
+    ]),
+    (8, "content_blobs", [
+        # Одинаковый контент (гороскоп дня, карта) хранится один раз и адресуется хешем
+        """
+        CREATE TABLE content_blobs (
+            id INTEGER PRIMARY KEY,
+            hash BLOB NOT NULL UNIQUE,
+            body TEXT NOT NULL,
+            refcount INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE TABLE favorites_new (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            content_id INTEGER NOT NULL REFERENCES content_blobs(id),
+            added_at TEXT NOT NULL
+        )
+        """,
+        "INSERT INTO favorites_new(id, user_id, content_type, content_id, added_at) "
+        "SELECT id, user_id, content_type, 0, added_at FROM favorites",
+        """
+        CREATE TABLE shared_content_new (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            content_type TEXT NOT NULL,
+            content_id INTEGER NOT NULL REFERENCES content_blobs(id),
+            share_text TEXT NOT NULL,
+            share_count INTEGER DEFAULT 0,
+            created_at TEXT NOT NULL
+        )
+        """,
+        "INSERT INTO shared_content_new(id, user_id, content_type, content_id, share_text, share_count, created_at) "
+        "SELECT id, user_id, content_type, 0, share_text, share_count, created_at FROM shared_content",
+        _move_content_to_blobs,
+        "DROP TABLE favorites",
+        "DROP TABLE shared_content",
+        "ALTER TABLE favorites_new RENAME TO favorites",
+        "ALTER TABLE shared_content_new RENAME TO shared_content",
+        "CREATE INDEX idx_favorites_user_added ON favorites(user_id, added_at)",
+        "CREATE INDEX idx_favorites_user_type ON favorites(user_id, content_type)",
+        "CREATE INDEX idx_shared_user_created ON shared_content(user_id, created_at)",
+        *_content_ref_triggers("favorites"),
+        *_content_ref_triggers("shared_content"),
+    ]),
+]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Текущая версия схемы базы данных"""
+    row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    return row[0] or 0
+
+
+def run_migrations(conn: sqlite3.Connection) -> int:
+    """Применить недостающие миграции по порядку, вернуть итоговую версию схемы"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+    """)
+    conn.commit()
+
+    for version, name, statements in MIGRATIONS:
+        # IMMEDIATE-блокировка: параллельно стартующие воркеры применяют миграцию ровно один раз
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if current_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version(version, name, applied_at) VALUES(?,?,?)",
+                (version, name, datetime.now(timezone.utc).isoformat())
+            )
+            conn.commit()
+            print(f"🗄️ Применена миграция {version}: {name}")
+        except Exception:
+            conn.rollback()
+            raise
+
+    return current_version(conn)
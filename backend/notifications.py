@@ -0,0 +1,122 @@
+import os
+import time
+import asyncio
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+# Настройки отправки сообщений через Telegram Bot API
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+TELEGRAM_RATE_LIMIT = float(os.getenv("TELEGRAM_RATE_LIMIT", "30"))  # сообщений в секунду на бота
+TELEGRAM_MAX_CONCURRENCY = int(os.getenv("TELEGRAM_MAX_CONCURRENCY", "20"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+TELEGRAM_CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "3"))
+TELEGRAM_READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "10"))
+
+
+class TokenBucket:
+    """Глобальный ограничитель скорости: каждый вызов резервирует следующий слот, пауза по retry_after"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_slot = 0.0
+        self._blocked_until = 0.0
+
+    async def acquire(self):
+        """Дождаться разрешения на одно сообщение"""
+        while True:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            # Слот, зарезервированный до паузы, переносится за её конец
+            if time.monotonic() >= self._blocked_until:
+                return
+
+    def pause(self, seconds: float):
+        """Остановить выдачу слотов всем отправителям (ответ 429 от Telegram)"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._next_slot = max(self._next_slot, self._blocked_until)
+
+
+class TelegramSender:
+    """Параллельная отправка сообщений бота через общий async клиент с ограничением скорости"""
+
+    def __init__(self, bot_token: str, base_url: str = TELEGRAM_API_BASE,
+                 rate: float = TELEGRAM_RATE_LIMIT, max_concurrency: int = TELEGRAM_MAX_CONCURRENCY,
+                 max_retries: int = TELEGRAM_MAX_RETRIES):
+        self.url = f"{base_url.rstrip('/')}/bot{bot_token}/sendMessage"
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(rate)
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.sent = 0
+        self.failed = 0
+        self.throttled = 0
+        self.retried = 0
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(TELEGRAM_READ_TIMEOUT, connect=TELEGRAM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+    async def send_message(self, chat_id: int, text: str) -> Tuple[bool, Optional[str]]:
+        """Отправить сообщение; возвращает (успех, описание ошибки)"""
+        if self._client is None:
+            raise RuntimeError("HTTP клиент Telegram не инициализирован")
+        message_data = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
+        error = None
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    self.retried += 1
+                await self.bucket.acquire()
+                try:
+                    response = await self._client.post(self.url, json=message_data)
+                except httpx.HTTPError as e:
+                    error = f"{type(e).__name__}: {e}"
+                    await asyncio.sleep(min(2 ** attempt, 30))
+                    continue
+
+                if response.status_code == 200:
+                    self.sent += 1
+                    return True, None
+                if response.status_code == 429:
+                    self.throttled += 1
+                    try:
+                        retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+                    except ValueError:
+                        retry_after = 1
+                    self.bucket.pause(float(retry_after))
+                    error = f"429 retry_after={retry_after}"
+                    continue
+                error = f"{response.status_code}: {response.text[:200]}"
+                if response.status_code < 500:
+                    # 400/403 (заблокировал бота, чат не найден) повторять бессмысленно
+                    break
+                await asyncio.sleep(min(2 ** attempt, 30))
+
+        self.failed += 1
+        return False, error
+
+    def stats(self) -> Dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "retried": self.retried,
+        }
@@ -0,0 +1,251 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from db import ConnectionPool
+from notifications import (TelegramSender, TELEGRAM_CONNECT_TIMEOUT, TELEGRAM_READ_TIMEOUT,
+                           TELEGRAM_MAX_RETRIES)
+
+# Настройки очереди уведомлений
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_DELAY = int(os.getenv("OUTBOX_RETRY_DELAY", "60"))  # секунд, удваивается с каждой попыткой
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+OUTBOX_STOP_TIMEOUT = float(os.getenv("OUTBOX_STOP_TIMEOUT", "10"))  # секунд на завершение текущей пачки
+# Через сколько секунд захваченная запись считается брошенной (процесс-владелец умер).
+# По умолчанию - с запасом на остановку и все повторы одного сообщения (таймауты и паузы до 30 с)
+OUTBOX_CLAIM_LEASE = float(os.getenv("OUTBOX_CLAIM_LEASE", str(
+    OUTBOX_STOP_TIMEOUT + (TELEGRAM_CONNECT_TIMEOUT + TELEGRAM_READ_TIMEOUT + 30) * (TELEGRAM_MAX_RETRIES + 1)
+)))
+
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class NotificationOutbox:
+    """Персистентная очередь push-уведомлений: пакетная постановка, захват пачками, повторы и возобновление после рестарта
+
+    Доставка "не менее одного раза": результат каждого сообщения записывается сразу после
+    отправки, а записи, захваченные остановленным процессом, возвращаются в очередь по
+    истечении OUTBOX_CLAIM_LEASE. Записи, которые в это время отправляют другие воркеры,
+    не трогаются. Повторно могут уйти только сообщения, отправлявшиеся в момент остановки
+    (не больше TELEGRAM_MAX_CONCURRENCY).
+    """
+
+    def __init__(self, pool: ConnectionPool, sender: TelegramSender,
+                 render: Callable[[str, str], Awaitable[str]],
+                 on_sent: Optional[Callable[[int, str], None]] = None,
+                 batch_size: int = OUTBOX_BATCH_SIZE, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 claim_lease: float = OUTBOX_CLAIM_LEASE):
+        self.pool = pool
+        self.sender = sender
+        self.render = render
+        self.on_sent = on_sent
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.claim_lease = claim_lease
+        self._next_recover = 0.0  # time.monotonic() следующей проверки брошенных записей
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self.enqueued = 0
+        self.delivered = 0
+        self.failed = 0
+        self.requeued = 0
+        self.last_batch: Optional[Dict] = None
+
+    def enqueue(self, entries: Iterable[Tuple[int, str]], notify_date: str) -> int:
+        """Поставить уведомления (user_id, знак) на дату; повторная постановка того же дня игнорируется"""
+        now = _utc_now()
+        rows = [(user_id, notify_date, sign, now, now) for user_id, sign in entries]
+        if not rows:
+            return 0
+        with self.pool.connection() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO notification_outbox(user_id, notify_date, zodiac_sign, available_at, created_at) "
+                "VALUES(?,?,?,?,?)",
+                rows
+            )
+            conn.commit()
+            inserted = conn.total_changes - before
+        self.enqueued += inserted
+        if inserted and self._wakeup is not None:
+            # enqueue может вызываться из потока исполнителя
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return inserted
+
+    def recover(self) -> int:
+        """Вернуть в очередь записи с истёкшим захватом и удалить старые завершённые"""
+        now = datetime.now(timezone.utc)
+        cutoff = (now - timedelta(days=OUTBOX_RETENTION_DAYS)).strftime("%Y-%m-%d")
+        lease_cutoff = (now - timedelta(seconds=self.claim_lease)).isoformat()
+        with self.pool.connection() as conn:
+            # Свежие захваты принадлежат живым воркерам: их пачки ещё отправляются
+            cur = conn.execute(
+                "UPDATE notification_outbox SET status='pending', claimed_at=NULL "
+                "WHERE status='sending' AND claimed_at < ?", (lease_cutoff,)
+            )
+            recovered = cur.rowcount
+            conn.execute(
+                "DELETE FROM notification_outbox WHERE status IN ('sent', 'failed') AND notify_date < ?", (cutoff,)
+            )
+            conn.commit()
+        self.requeued += recovered
+        return recovered
+
+    def claim(self) -> List[Tuple[int, int, str, str, int]]:
+        """Захватить пачку готовых к отправке записей"""
+        now = _utc_now()
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT id, user_id, zodiac_sign, notify_date, attempts FROM notification_outbox "
+                "WHERE status='pending' AND available_at <= ? ORDER BY available_at LIMIT ?",
+                (now, self.batch_size)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE notification_outbox SET status='sending', claimed_at=?, attempts=attempts+1 WHERE id=?",
+                [(now, row[0]) for row in rows]
+            )
+            conn.commit()
+        return rows
+
+    def complete(self, results: List[Tuple[int, int, bool, Optional[str]]]):
+        """Отметить результаты: (id, попытка, успех, ошибка)"""
+        now = datetime.now(timezone.utc)
+        sent, retry, failed = [], [], []
+        for outbox_id, attempt, ok, error in results:
+            if ok:
+                sent.append((now.isoformat(), outbox_id))
+            elif attempt >= self.max_attempts:
+                failed.append((error, outbox_id))
+            else:
+                available_at = now + timedelta(seconds=OUTBOX_RETRY_DELAY * 2 ** (attempt - 1))
+                retry.append((error, available_at.isoformat(), outbox_id))
+        with self.pool.connection() as conn:
+            conn.executemany(
+                "UPDATE notification_outbox SET status='sent', sent_at=?, last_error=NULL WHERE id=?", sent
+            )
+            conn.executemany(
+                "UPDATE notification_outbox SET status='pending', last_error=?, available_at=? WHERE id=?", retry
+            )
+            conn.executemany(
+                "UPDATE notification_outbox SET status='failed', last_error=? WHERE id=?", failed
+            )
+            conn.commit()
+        self.delivered += len(sent)
+        self.failed += len(failed)
+
+    async def deliver_batch(self) -> int:
+        """Отправить одну пачку; возвращает число обработанных записей"""
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(None, self.claim)
+        if not rows:
+            return 0
+        started = time.monotonic()
+        sent = 0
+
+        async def record(batch_rows, ok: bool, error: Optional[str]):
+            nonlocal sent
+            await loop.run_in_executor(None, self.complete, [(row[0], row[4] + 1, ok, error) for row in batch_rows])
+            if ok:
+                sent += len(batch_rows)
+                if self.on_sent:
+                    for row in batch_rows:
+                        self.on_sent(row[1], row[2])
+
+        async def deliver(row, text: str):
+            try:
+                ok, error = await self.sender.send_message(row[1], text)
+            except Exception as e:
+                ok, error = False, f"{type(e).__name__}: {e}"
+            # Результат фиксируется сразу, а не после всей пачки: при остановке посреди пачки
+            # уже доставленные сообщения не вернутся в очередь
+            await record([row], ok, error)
+
+        try:
+            messages: Dict[Tuple[str, str], str] = {}
+            for _, _, sign, notify_date, _ in rows:
+                if (sign, notify_date) not in messages:
+                    messages[(sign, notify_date)] = await self.render(sign, notify_date)
+        except Exception as e:
+            # Захваченная пачка не должна зависнуть в статусе sending до рестарта
+            await record(rows, False, f"{type(e).__name__}: {e}")
+        else:
+            await asyncio.gather(*(deliver(row, messages[(row[2], row[3])]) for row in rows))
+
+        elapsed = time.monotonic() - started
+        self.last_batch = {
+            "size": len(rows),
+            "sent": sent,
+            "duration_ms": int(elapsed * 1000),
+            "messages_per_second": round(len(rows) / elapsed, 1) if elapsed else None,
+        }
+        return len(rows)
+
+    async def _run(self):
+        """Рабочий цикл: обрабатывает пачки, пока есть готовые записи, иначе ждёт постановки или таймера повторов"""
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            if time.monotonic() >= self._next_recover:
+                # Записи воркера, умершего после нашего старта, освобождаются по истечении захвата
+                self._next_recover = time.monotonic() + self.claim_lease / 2
+                try:
+                    recovered = await loop.run_in_executor(None, self.recover)
+                    if recovered:
+                        print(f"📬 Возобновлена доставка {recovered} уведомлений")
+                except Exception as e:
+                    print(f"Ошибка возврата захваченных уведомлений: {e}")
+            try:
+                processed = await self.deliver_batch()
+            except Exception as e:
+                print(f"Ошибка обработки очереди уведомлений: {e}")
+                processed = 0
+            if processed:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        """Запустить рабочий цикл; первым шагом он вернёт в очередь брошенные записи"""
+        if self._task is None:
+            self._stopping = False
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дождаться завершения текущей пачки и остановить рабочий цикл"""
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(self._task, timeout=OUTBOX_STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+    def backlog(self) -> Dict[str, int]:
+        """Число записей по статусам"""
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM notification_outbox GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+    def stats(self) -> Dict:
+        return {
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "requeued": self.requeued,
+            "last_batch": self.last_batch,
+        }
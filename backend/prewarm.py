@@ -0,0 +1,126 @@
+import os
+import time
+import asyncio
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional
+
+from db import ConnectionPool
+from cache import next_utc_midnight
+
+# Настройки прогрева кеша
+PREWARM_LEAD_SECONDS = int(os.getenv("PREWARM_LEAD_SECONDS", "300"))  # за сколько до полуночи UTC
+PREWARM_RETRIES = int(os.getenv("PREWARM_RETRIES", "3"))
+PREWARM_BACKOFF = float(os.getenv("PREWARM_BACKOFF", "2"))  # секунд, удваивается с каждой попыткой
+
+
+class PrewarmScheduler:
+    """Фоновый прогрев daily_cache для всех знаков перед сменой суток по UTC"""
+
+    def __init__(self, pool: ConnectionPool, signs: Iterable[str],
+                 compute: Callable[[str, str], Awaitable[Optional[str]]],
+                 on_warm: Optional[Callable[[str, str, str], None]] = None,
+                 lead_seconds: int = PREWARM_LEAD_SECONDS, retries: int = PREWARM_RETRIES,
+                 backoff: float = PREWARM_BACKOFF):
+        self.pool = pool
+        self.signs = list(signs)
+        self.compute = compute
+        self.on_warm = on_warm
+        self.lead_seconds = lead_seconds
+        self.retries = retries
+        self.backoff = backoff
+        self.last_run: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _missing_signs(self, date: str) -> List[str]:
+        with self.pool.connection() as conn:
+            rows = conn.execute("SELECT sign FROM daily_cache WHERE date=?", (date,)).fetchall()
+        existing = {row[0] for row in rows}
+        return [sign for sign in self.signs if sign not in existing]
+
+    def _store(self, date: str, texts: Dict[str, str], run: Dict):
+        """Записать тексты и итог прогона одной транзакцией"""
+        now = datetime.now(timezone.utc).isoformat()
+        with self.pool.connection() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO daily_cache(sign, date, text, created_at) VALUES(?,?,?,?)",
+                [(sign, date, text, now) for sign, text in texts.items()]
+            )
+            conn.execute(
+                "INSERT INTO prewarm_runs(date, started_at, duration_ms, warmed, failed, status) VALUES(?,?,?,?,?,?)",
+                (date, run["started_at"], run["duration_ms"], run["warmed"], run["failed"], run["status"])
+            )
+            conn.commit()
+
+    async def warm(self, date: str) -> Dict:
+        """Посчитать гороскопы на дату для знаков, которых ещё нет в кеше; неудачные повторяются с backoff"""
+        loop = asyncio.get_running_loop()
+        started_at = datetime.now(timezone.utc).isoformat()
+        started = time.monotonic()
+
+        pending = await loop.run_in_executor(None, self._missing_signs, date)
+        texts: Dict[str, str] = {}
+        for attempt in range(self.retries + 1):
+            if not pending:
+                break
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+            results = await asyncio.gather(*(self.compute(sign, date) for sign in pending), return_exceptions=True)
+            failed = []
+            for sign, result in zip(pending, results):
+                if isinstance(result, str) and result:
+                    texts[sign] = result
+                else:
+                    if isinstance(result, Exception):
+                        print(f"Ошибка прогрева {sign} на {date}: {result}")
+                    failed.append(sign)
+            pending = failed
+
+        run = {
+            "date": date,
+            "started_at": started_at,
+            "duration_ms": int((time.monotonic() - started) * 1000),
+            "warmed": len(texts),
+            "failed": len(pending),
+            "failed_signs": pending,
+            "status": "ok" if not pending else ("partial" if texts else "failed"),
+        }
+        await loop.run_in_executor(None, self._store, date, texts, run)
+        if self.on_warm:
+            for sign, text in texts.items():
+                self.on_warm(sign, date, text)
+
+        self.last_run = run
+        print(f"🔥 Прогрев кеша на {date}: {run['warmed']} готово, {run['failed']} ошибок, {run['duration_ms']} мс")
+        return run
+
+    async def _run(self):
+        """Цикл планировщика: сегодня при старте, затем завтрашний день за lead_seconds до полуночи"""
+        try:
+            await self.warm(datetime.now(timezone.utc).strftime("%Y-%m-%d"))
+        except Exception as e:
+            print(f"Ошибка прогрева кеша: {e}")
+        while True:
+            delay = next_utc_midnight() - self.lead_seconds - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            boundary = next_utc_midnight()
+            tomorrow = (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y-%m-%d")
+            try:
+                await self.warm(tomorrow)
+            except Exception as e:
+                print(f"Ошибка прогрева кеша: {e}")
+            # Ждём наступления новых суток, чтобы не прогревать ту же дату повторно
+            await asyncio.sleep(max(0.0, boundary - time.time()) + 1)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,130 @@
+import io
+import os
+import hmac
+import time
+import random
+import marshal
+import pstats
+import cProfile
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from metrics import request_db_usage
+
+# Настройки профилирования запросов (по умолчанию выключено: middleware не подключается)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")  # заголовок X-Profile-Secret: профилировать запрос и читать профили
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # доля случайных запросов, например 0.001
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))  # последних профилей в памяти
+
+PROFILE_HEADER = b"x-profile-secret"
+
+
+def secret_matches(value: Optional[str]) -> bool:
+    return bool(PROFILE_SECRET) and value is not None and hmac.compare_digest(value, PROFILE_SECRET)
+
+
+class ProfileStore:
+    """Кольцевой буфер последних профилей запросов"""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self._profiles = deque(maxlen=keep)
+        self._next_id = 1
+        self.busy = False  # cProfile перехватывает весь поток, поэтому одновременно профилируется один запрос
+        self.captured = 0
+        self.skipped_busy = 0
+
+    def add(self, meta: Dict, profile: cProfile.Profile) -> int:
+        # Хранятся байты в формате pstats: pstats.Stats(profile) забирает и обнуляет profile.stats
+        profile.create_stats()
+        profile_id = self._next_id
+        self._next_id += 1
+        self._profiles.append((profile_id, meta, marshal.dumps(profile.stats)))
+        self.captured += 1
+        return profile_id
+
+    def list(self) -> List[Dict]:
+        return [{"id": profile_id, **meta} for profile_id, meta, _ in reversed(self._profiles)]
+
+    def get(self, profile_id: int) -> Optional[tuple]:
+        for entry in self._profiles:
+            if entry[0] == profile_id:
+                return entry
+        return None
+
+    @staticmethod
+    def report(dump: bytes, sort: str, limit: int) -> str:
+        """Текстовый отчёт pstats по сохранённому профилю"""
+        stream = io.StringIO()
+        stats = pstats.Stats(stream=stream)
+        stats.stats = marshal.loads(dump)
+        stats.get_top_level_stats()
+        stats.sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def stats(self) -> Dict:
+        return {"stored": len(self._profiles), "captured": self.captured, "skipped_busy": self.skipped_busy}
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: cProfile запроса с заголовком X-Profile-Secret или случайной выборки
+
+    Профилируется поток event loop целиком, поэтому в профиль попадают и корутины
+    других запросов, выполнявшиеся во время ожиданий. Работа в потоках SQLite не
+    видна - её время показывают поля db_ms и db_queries.
+    """
+
+    def __init__(self, app, store: ProfileStore, sample_rate: float = PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.store = store
+        self.sample_rate = sample_rate
+
+    def _trigger(self, scope) -> Optional[str]:
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return "header" if secret_matches(value.decode("latin-1")) else None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        trigger = self._trigger(scope) if scope["type"] == "http" else None
+        if trigger is None:
+            await self.app(scope, receive, send)
+            return
+        if self.store.busy:
+            self.store.skipped_busy += 1
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profile = cProfile.Profile()
+        started_at = datetime.now(timezone.utc).isoformat()
+        started = time.perf_counter()
+        self.store.busy = True
+        profile.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile.disable()
+            self.store.busy = False
+            usage = request_db_usage.get() or (0.0, 0)
+            self.store.add({
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope["query_string"].decode("latin-1"),
+                "status": status,
+                "trigger": trigger,
+                "started_at": started_at,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                "db_ms": round(usage[0] * 1000, 3),
+                "db_queries": usage[1],
+            }, profile)
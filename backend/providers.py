@@ -0,0 +1,102 @@
+import os
+import asyncio
+from typing import Optional, Dict
+
+import httpx
+
+# Настройки внешнего провайдера гороскопов
+HOROSCOPE_PROVIDER = os.getenv("HOROSCOPE_PROVIDER", "aztro")  # aztro | stub
+HOROSCOPE_API_URL = os.getenv("HOROSCOPE_API_URL", "https://aztro.sameerkumar.website/")
+PROVIDER_CONNECT_TIMEOUT = float(os.getenv("PROVIDER_CONNECT_TIMEOUT", "2"))
+PROVIDER_READ_TIMEOUT = float(os.getenv("PROVIDER_READ_TIMEOUT", "5"))
+PROVIDER_MAX_CONCURRENCY = int(os.getenv("PROVIDER_MAX_CONCURRENCY", "10"))
+PROVIDER_MAX_CONNECTIONS = int(os.getenv("PROVIDER_MAX_CONNECTIONS", "20"))
+STUB_PROVIDER_DELAY = float(os.getenv("STUB_PROVIDER_DELAY", "0"))
+
+
+class AztroProvider:
+    """Провайдер aztro: общий keep-alive пул соединений и ограничение параллельных запросов"""
+
+    name = "aztro"
+
+    def __init__(self, api_key: str, url: str = HOROSCOPE_API_URL,
+                 max_concurrency: int = PROVIDER_MAX_CONCURRENCY):
+        self.enabled = bool(api_key)
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.requests = 0
+        self.errors = 0
+
+    async def start(self):
+        """Создать HTTP клиент (вызывается из lifespan)"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(PROVIDER_READ_TIMEOUT, connect=PROVIDER_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=PROVIDER_MAX_CONNECTIONS,
+                    max_keepalive_connections=PROVIDER_MAX_CONNECTIONS,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        """Закрыть HTTP клиент"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+    async def fetch(self, english_sign: str, day: str = "today") -> Optional[str]:
+        """Получить описание дня для знака (day: yesterday/today/tomorrow); None при ошибке или пустом ответе"""
+        if self._client is None:
+            raise RuntimeError("HTTP клиент провайдера не инициализирован")
+        async with self._semaphore:
+            self.requests += 1
+            try:
+                response = await self._client.post(self.url, params={"sign": english_sign, "day": day})
+                if response.status_code == 200:
+                    return response.json().get("description") or None
+                self.errors += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Ошибка получения реальных данных: {e}")
+        return None
+
+    def stats(self) -> Dict:
+        return {"provider": self.name, "requests": self.requests, "errors": self.errors}
+
+
+class StubProvider:
+    """Локальная заглушка провайдера для тестов и нагрузочных прогонов"""
+
+    name = "stub"
+    enabled = True
+
+    def __init__(self, delay: float = STUB_PROVIDER_DELAY):
+        self.delay = delay
+        self.requests = 0
+        self.errors = 0
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def fetch(self, english_sign: str, day: str = "today") -> Optional[str]:
+        self.requests += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return f"Stub forecast for {english_sign}."
+
+    def stats(self) -> Dict:
+        return {"provider": self.name, "requests": self.requests, "errors": self.errors}
+
+
+def create_provider(api_key: str):
+    """Выбрать провайдера по настройке HOROSCOPE_PROVIDER"""
+    if HOROSCOPE_PROVIDER == "stub":
+        return StubProvider()
+    return AztroProvider(api_key)
@@ -0,0 +1,144 @@
+import os
+import json
+import gzip
+import time
+import asyncio
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+from db import ConnectionPool
+from blobs import collect_blobs
+
+# Настройки хранения аналитики
+ANALYTICS_RETENTION_DAYS = int(os.getenv("ANALYTICS_RETENTION_DAYS", "90"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "86400"))  # секунд между запусками
+RETENTION_START_DELAY = int(os.getenv("RETENTION_START_DELAY", "300"))  # первый запуск после старта
+VACUUM_PAGES_PER_RUN = int(os.getenv("VACUUM_PAGES_PER_RUN", "0"))  # 0 - освободить все свободные страницы
+
+
+def database_size(conn) -> int:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count
+
+
+class RetentionJob:
+    """Архивация и удаление старых событий user_analytics
+
+    Агрегаты (user_action_counts, user_action_daily) обновляются при записи событий,
+    поэтому сырые строки старше окна хранения уже учтены в них и могут быть удалены.
+    Перед удалением строки выгружаются в gzip NDJSON по дням: <ARCHIVE_DIR>/user_analytics/<дата>.ndjson.gz
+    Там же удаляются блобы content_blobs, на которые не осталось ссылок, и устаревшие строки day_cards.
+    """
+
+    def __init__(self, pool: ConnectionPool, retention_days: int = ANALYTICS_RETENTION_DAYS,
+                 archive_dir: str = ARCHIVE_DIR, batch_size: int = RETENTION_BATCH_SIZE):
+        self.pool = pool
+        self.retention_days = retention_days
+        self.archive_dir = os.path.join(archive_dir, "user_analytics")
+        self.batch_size = batch_size
+        self.last_run: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _archive(self, rows: List[tuple]) -> List[str]:
+        """Дописать строки в файлы архива по дате события"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        partitions: Dict[str, List[str]] = {}
+        for row_id, user_id, action, data, timestamp in rows:
+            partitions.setdefault(timestamp[:10], []).append(json.dumps({
+                "id": row_id,
+                "user_id": user_id,
+                "action": action,
+                "data": json.loads(data) if data else None,
+                "timestamp": timestamp,
+            }, ensure_ascii=False))
+        files = []
+        for day, lines in partitions.items():
+            path = os.path.join(self.archive_dir, f"{day}.ndjson.gz")
+            # Режим добавления создаёт новый gzip-член; gzip.open читает такие файлы целиком
+            with gzip.open(path, "at", encoding="utf-8") as archive:
+                archive.write("\n".join(lines) + "\n")
+            files.append(path)
+        return files
+
+    def run_once(self) -> Dict:
+        """Выгрузить и удалить события старше окна хранения, затем освободить место"""
+        started = time.monotonic()
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).isoformat()
+        archived = 0
+        files = set()
+
+        with self.pool.connection() as conn:
+            size_before = database_size(conn)
+            last_id = 0
+            while True:
+                # Идём по id: события пишутся в порядке времени, старые строки в начале таблицы
+                rows = conn.execute(
+                    "SELECT id, user_id, action, data, timestamp FROM user_analytics "
+                    "WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, self.batch_size)
+                ).fetchall()
+                expired = [row for row in rows if row[4] < cutoff]
+                if expired:
+                    files.update(self._archive(expired))
+                    conn.executemany("DELETE FROM user_analytics WHERE id=?", [(row[0],) for row in expired])
+                    conn.commit()
+                    archived += len(expired)
+                if len(expired) < len(rows) or not rows:
+                    break
+                last_id = rows[-1][0]
+
+            # Блобы контента без ссылок из favorites/shared_content
+            blobs_collected = collect_blobs(conn)
+
+            # Карты дня теперь вычисляются; сохранённые ранее строки нужны только на свою дату
+            day_cards_pruned = conn.execute(
+                "DELETE FROM day_cards WHERE date < ?", (datetime.now(timezone.utc).strftime("%Y-%m-%d"),)
+            ).rowcount
+            conn.commit()
+
+            # PRAGMA освобождает по странице на шаг; execute() делает лишь один шаг, executescript() - все.
+            # Без auto_vacuum=INCREMENTAL (см. db.ensure_incremental_vacuum) ничего не делает
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_PAGES_PER_RUN});" if VACUUM_PAGES_PER_RUN
+                               else "PRAGMA incremental_vacuum;")
+            size_after = database_size(conn)
+
+        run = {
+            "cutoff": cutoff,
+            "archived": archived,
+            "blobs_collected": blobs_collected,
+            "day_cards_pruned": day_cards_pruned,
+            "files": sorted(files),
+            "duration_ms": int((time.monotonic() - started) * 1000),
+            "reclaimed_bytes": max(0, size_before - size_after),
+            "database_bytes": size_after,
+        }
+        self.last_run = run
+        print(f"🗄️ Ротация аналитики: {archived} событий в архив, освобождено {run['reclaimed_bytes']} байт, "
+              f"{run['duration_ms']} мс")
+        return run
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.sleep(RETENTION_START_DELAY)
+        while True:
+            try:
+                await loop.run_in_executor(None, self.run_once)
+            except Exception as e:
+                print(f"Ошибка ротации аналитики: {e}")
+            await asyncio.sleep(RETENTION_INTERVAL)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
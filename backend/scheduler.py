@@ -0,0 +1,209 @@
+import os
+import time
+import heapq
+import asyncio
+from datetime import datetime, date as date_type, time as time_type, timezone, timedelta, tzinfo
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+from db import ConnectionPool
+from outbox import NotificationOutbox
+
+# Настройки планировщика уведомлений
+NOTIFY_CATCHUP_HOURS = float(os.getenv("NOTIFY_CATCHUP_HOURS", "6"))  # догонять пропущенные слоты не старше
+NOTIFY_RECHECK_CHUNK = 500  # user_id в одном запросе сверки с user_settings
+
+
+@lru_cache(maxsize=512)
+def resolve_timezone(name: Optional[str]) -> tzinfo:
+    """Часовой пояс пользователя по имени IANA, UTC при ошибке"""
+    if not name or ZoneInfo is None:
+        return timezone.utc
+    try:
+        return ZoneInfo(name)
+    except Exception:
+        return timezone.utc
+
+
+def parse_notification_time(value: str) -> Optional[time_type]:
+    try:
+        hours, minutes = value.split(":")
+        return time_type(int(hours), int(minutes))
+    except (AttributeError, ValueError):
+        return None
+
+
+def fire_instant(local_date: date_type, at: time_type, tz: tzinfo) -> datetime:
+    """Момент отправки в UTC для локальной даты и времени пользователя"""
+    return datetime.combine(local_date, at, tzinfo=tz).astimezone(timezone.utc)
+
+
+class NotificationScheduler:
+    """Планировщик уведомлений на куче: пользователи упорядочены по ближайшему моменту отправки в UTC
+
+    Таблица user_settings читается целиком только при старте; далее расписание меняется
+    точечно при сохранении настроек, а цикл просыпается лишь к ближайшему слоту.
+    Настройки могли сохраниться в другом воркере, поэтому перед постановкой в outbox
+    наступившие слоты сверяются с user_settings по первичному ключу, устаревшие
+    перепланируются по актуальной строке.
+    """
+
+    def __init__(self, pool: ConnectionPool, outbox: NotificationOutbox,
+                 catchup_hours: float = NOTIFY_CATCHUP_HOURS):
+        self.pool = pool
+        self.outbox = outbox
+        self.catchup = timedelta(hours=catchup_hours)
+        self._heap: List[Tuple[float, int, int, str]] = []  # (момент UTC, user_id, версия, локальная дата)
+        self._users: Dict[int, Tuple[int, str, time_type, tzinfo]] = {}  # user_id -> (версия, знак, время, пояс)
+        self._version = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.fired = 0
+        self.caught_up = 0
+        self.stale = 0
+
+    def _push(self, user_id: int, version: int, instant: datetime, tz: tzinfo):
+        local_date = instant.astimezone(tz).date().isoformat()
+        heapq.heappush(self._heap, (instant.timestamp(), user_id, version, local_date))
+
+    def schedule(self, user_id: int, zodiac_sign: Optional[str], notification_time: Optional[str],
+                 timezone_name: Optional[str] = None, catch_up: bool = False) -> bool:
+        """Добавить или обновить расписание пользователя; без знака или времени - снять с расписания"""
+        at = parse_notification_time(notification_time) if zodiac_sign and notification_time else None
+        if at is None:
+            self._users.pop(user_id, None)
+            return False
+
+        tz = resolve_timezone(timezone_name)
+        self._version += 1
+        self._users[user_id] = (self._version, zodiac_sign, at, tz)
+
+        now = datetime.now(timezone.utc)
+        local_today = now.astimezone(tz).date()
+        instants = [fire_instant(local_today + timedelta(days=offset), at, tz) for offset in (-1, 0, 1)]
+        past = [instant for instant in instants if instant <= now]
+        if catch_up and past and now - past[-1] <= self.catchup:
+            # Пропущенный слот (простой процесса); повтор исключает уникальность outbox по дню
+            self._push(user_id, self._version, past[-1], tz)
+            self.caught_up += 1
+        else:
+            self._push(user_id, self._version, min(instant for instant in instants if instant > now), tz)
+
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def load(self) -> int:
+        """Начальная загрузка расписания из user_settings"""
+        with self.pool.connection() as conn:
+            rows = conn.execute("""
+                SELECT user_id, zodiac_sign, notification_time, timezone
+                FROM user_settings
+                WHERE zodiac_sign IS NOT NULL AND notification_time IS NOT NULL
+            """).fetchall()
+        for user_id, zodiac_sign, notification_time, timezone_name in rows:
+            self.schedule(user_id, zodiac_sign, notification_time, timezone_name, catch_up=True)
+        return len(self._users)
+
+    def pop_due(self, now: float) -> Dict[str, List[Tuple[int, str]]]:
+        """Извлечь наступившие слоты, сгруппированные по локальной дате, и запланировать следующие"""
+        due: Dict[str, List[Tuple[int, str]]] = {}
+        while self._heap and self._heap[0][0] <= now:
+            fire_ts, user_id, version, local_date = heapq.heappop(self._heap)
+            entry = self._users.get(user_id)
+            if entry is None or entry[0] != version:
+                continue  # устаревшая запись после изменения настроек
+            _, zodiac_sign, at, tz = entry
+            due.setdefault(local_date, []).append((user_id, zodiac_sign))
+            next_date = date_type.fromisoformat(local_date) + timedelta(days=1)
+            self._push(user_id, version, fire_instant(next_date, at, tz), tz)
+        return due
+
+    def current_settings(self, user_ids: List[int]) -> Dict[int, Tuple[Optional[str], Optional[str], Optional[str]]]:
+        """Актуальные (знак, время, пояс) пользователей из user_settings"""
+        current = {}
+        with self.pool.connection() as conn:
+            for start in range(0, len(user_ids), NOTIFY_RECHECK_CHUNK):
+                chunk = user_ids[start:start + NOTIFY_RECHECK_CHUNK]
+                rows = conn.execute(
+                    f"SELECT user_id, zodiac_sign, notification_time, timezone FROM user_settings "
+                    f"WHERE user_id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                current.update((row[0], row[1:]) for row in rows)
+        return current
+
+    def drop_stale(self, due: Dict[str, List[Tuple[int, str]]],
+                   current: Dict[int, Tuple[Optional[str], Optional[str], Optional[str]]]) -> Dict[str, List[Tuple[int, str]]]:
+        """Оставить слоты, совпадающие с user_settings; остальных пользователей перепланировать"""
+        fresh: Dict[str, List[Tuple[int, str]]] = {}
+        for local_date, entries in due.items():
+            for user_id, zodiac_sign in entries:
+                entry = self._users.get(user_id)
+                sign, notification_time, timezone_name = current.get(user_id, (None, None, None))
+                at = parse_notification_time(notification_time) if notification_time else None
+                if entry is not None and entry[1:] == (sign, at, resolve_timezone(timezone_name)):
+                    fresh.setdefault(local_date, []).append((user_id, zodiac_sign))
+                    continue
+                self.stale += 1
+                self.schedule(user_id, sign, notification_time, timezone_name)
+        return fresh
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            due = self.pop_due(time.time())
+            if due:
+                try:
+                    current = await loop.run_in_executor(
+                        None, self.current_settings, [user_id for entries in due.values() for user_id, _ in entries]
+                    )
+                    due = self.drop_stale(due, current)
+                except Exception as e:
+                    print(f"Ошибка сверки расписания уведомлений: {e}")
+            for local_date, entries in due.items():
+                try:
+                    await loop.run_in_executor(None, self.outbox.enqueue, entries, local_date)
+                    self.fired += len(entries)
+                except Exception as e:
+                    print(f"Ошибка постановки уведомлений на {local_date}: {e}")
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def start(self):
+        if self._task is None:
+            loaded = self.load()
+            print(f"⏰ Расписание уведомлений: {loaded} пользователей, догнать пропущенных: {self.caught_up}")
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+    def stats(self) -> Dict:
+        next_fire = datetime.fromtimestamp(self._heap[0][0], timezone.utc).isoformat() if self._heap else None
+        return {
+            "scheduled_users": len(self._users),
+            "heap_size": len(self._heap),
+            "fired": self.fired,
+            "caught_up": self.caught_up,
+            "stale": self.stale,
+            "next_fire_at": next_fire,
+        }
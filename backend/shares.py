@@ -0,0 +1,102 @@
+import os
+import json
+import asyncio
+from typing import Dict, Optional
+
+import dal
+from db import AsyncDatabase
+from cache import TTLCache
+
+# Настройки счётчика просмотров репостов
+SHARE_CACHE_SIZE = int(os.getenv("SHARE_CACHE_SIZE", "2048"))
+SHARE_FLUSH_INTERVAL = float(os.getenv("SHARE_FLUSH_INTERVAL", "5"))  # секунд
+
+
+class ShareViews:
+    """Кеш опубликованного контента и отложенная пакетная запись счётчиков просмотров
+
+    Просмотры копятся в памяти и периодически записываются одной транзакцией.
+    В пределах процесса значение views не убывает: при повторной загрузке строки
+    к share_count из БД добавляются ещё не записанные просмотры.
+    """
+
+    def __init__(self, database: AsyncDatabase, cache_size: int = SHARE_CACHE_SIZE,
+                 flush_interval: float = SHARE_FLUSH_INTERVAL):
+        self.database = database
+        self.flush_interval = flush_interval
+        self._cache = TTLCache(cache_size)
+        self._pending: Dict[int, int] = {}
+        self._flushing: Dict[int, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushed_views = 0
+
+    async def _load(self, share_id: int) -> Optional[Dict]:
+        row = await self.database.read(dal.get_shared_content, share_id)
+        if not row:
+            return None
+        # Счётчики берутся после чтения: за время ожидания могли прийти новые просмотры
+        unflushed = self._pending.get(share_id, 0) + self._flushing.get(share_id, 0)
+        return {
+            "content_type": row[0],
+            "content": json.loads(row[1]),
+            "share_text": row[2],
+            "views": row[3] + unflushed,
+            "created_at": row[4]
+        }
+
+    async def view(self, share_id: int) -> Optional[Dict]:
+        """Засчитать просмотр и вернуть контент; None, если репост не найден"""
+        entry = self._cache.get(share_id)
+        if entry is None:
+            entry = await self._load(share_id)
+            if entry is None:
+                return None
+            # Параллельный запрос мог загрузить строку раньше - используем его запись
+            entry = self._cache.get(share_id) or entry
+            self._cache.set(share_id, entry)
+        entry["views"] += 1
+        self._pending[share_id] = self._pending.get(share_id, 0) + 1
+        return dict(entry)
+
+    async def flush(self):
+        """Записать накопленные просмотры одной транзакцией"""
+        if not self._pending:
+            return
+        self._flushing, self._pending = self._pending, {}
+        try:
+            await self.database.write(dal.add_share_views, self._flushing)
+            self.flushed_views += sum(self._flushing.values())
+        except Exception as e:
+            # Возвращаем незаписанные просмотры, чтобы записать их в следующий раз
+            for share_id, count in self._flushing.items():
+                self._pending[share_id] = self._pending.get(share_id, 0) + count
+            print(f"Ошибка записи просмотров: {e}")
+        finally:
+            self._flushing = {}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить фоновую запись и сбросить оставшиеся просмотры"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            **self._cache.stats(),
+            "pending_views": sum(self._pending.values()),
+            "flushed_views": self.flushed_views,
+        }
@@ -0,0 +1,39 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Объединение одновременных вычислений по одному ключу: работа выполняется один раз, результат получают все"""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнить fn для ключа или дождаться уже идущего вычисления"""
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(self._run(key, fn))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        # shield: отмена одного клиента не прерывает общее вычисление для остальных
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await fn()
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight),
+        }
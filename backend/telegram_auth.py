@@ -0,0 +1,85 @@
+import os
+import json
+import time
+import hmac
+import hashlib
+from functools import lru_cache
+from urllib.parse import unquote, parse_qs
+from typing import Optional, Dict
+
+from cache import TTLCache
+
+# Настройки проверки initData
+INIT_DATA_MAX_AGE = int(os.getenv("INIT_DATA_MAX_AGE", "86400"))  # секунд с auth_date, 0 - без ограничения
+INIT_DATA_CACHE_SIZE = int(os.getenv("INIT_DATA_CACHE_SIZE", "10000"))
+INIT_DATA_CACHE_TTL = int(os.getenv("INIT_DATA_CACHE_TTL", "3600"))  # если срок auth_date не ограничен
+
+
+class InitDataExpired(Exception):
+    """Подпись initData верна, но auth_date старше INIT_DATA_MAX_AGE: клиенту нужна новая сессия"""
+
+
+@lru_cache(maxsize=4)
+def derive_secret_key(bot_token: str) -> bytes:
+    """Ключ проверки подписи WebApp: HMAC("WebAppData", BOT_TOKEN), считается один раз на токен"""
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+class InitDataVerifier:
+    """Проверка initData Telegram WebApp с кешем уже проверенных строк"""
+
+    def __init__(self, bot_token: str, max_age: int = INIT_DATA_MAX_AGE,
+                 cache_size: int = INIT_DATA_CACHE_SIZE):
+        self.bot_token = bot_token
+        self.max_age = max_age
+        self._verified = TTLCache(cache_size)
+
+    def verify(self, init_data: str) -> Optional[dict]:
+        """Пользователь из подписанного initData или None; InitDataExpired, если подпись верна, но срок истёк"""
+        if not init_data:
+            return None
+        user = self._verified.get(init_data)
+        if user is not None:
+            return user
+
+        expired = False
+        try:
+            parsed_data = parse_qs(init_data)
+            received_hash = parsed_data.get('hash', [''])[0]
+            if not received_hash:
+                return None
+
+            data_string = '\n'.join(sorted(
+                f"{key}={value[0]}" for key, value in parsed_data.items() if key != 'hash'
+            ))
+            calculated_hash = hmac.new(
+                derive_secret_key(self.bot_token), data_string.encode(), hashlib.sha256
+            ).hexdigest()
+            if not hmac.compare_digest(calculated_hash, received_hash):
+                return None
+
+            now = time.time()
+            if self.max_age:
+                auth_date = int(parsed_data.get('auth_date', ['0'])[0])
+                expires_at = auth_date + self.max_age
+                if expires_at <= now:
+                    # Не None: иначе обработчики подставили бы общий тестовый аккаунт
+                    expired = True
+            else:
+                expires_at = now + INIT_DATA_CACHE_TTL
+
+            user_data = parsed_data.get('user', [''])[0]
+            if user_data and not expired:
+                user = json.loads(unquote(user_data))
+                self._verified.set(init_data, user, expires_at=expires_at)
+                return user
+
+        except Exception as e:
+            print(f"Ошибка проверки Telegram данных: {e}")
+
+        if expired:
+            raise InitDataExpired()
+        return None
+
+    def stats(self) -> Dict:
+        return self._verified.stats()